@@ -0,0 +1,11 @@
+""" Benchmarks for ce_common.
+
+Hot path benchmarks (suite_*.py) are run by run.py, which saves results as
+json baselines and compares runs:
+
+    python -m benchmarks.run --save base          # from py/
+    python -m benchmarks.run --compare base       # flags slowdowns vs. base
+    python -m benchmarks.run compare base.json new.json --threshold 1.2
+
+bench_*.py are standalone comparisons between implementations.
+"""
@@ -0,0 +1,89 @@
+""" Benchmark dtype-preserving complex ops in ce_common.tfutil on CPU.
+
+Compares l2_normalize of a complex64 tensor computed
+    - 'safe_cast': norm via tf.abs, both cast with safe_cast, complex product
+    - 'complex128': promoting to complex128 (cost of an upcast)
+    - 'real_imag': |x|**2 from real/imag parts, real/imag scaled separately in float32
+    - 'tfutil': ce_common.tfutil.l2_normalize (norm via tf.abs, cast to complex64, product)
+
+Memory is the total size of the tensors produced by each variant's ops.
+
+Usage (from py/): python -m benchmarks.bench_complex [--n 256] [--m 4096] [--repeat 20]
+"""
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from ce_common import tfutil
+
+
+def l2_normalize_safe_cast(x, axis=None, eps=1e-12):
+    inorm = tf.rsqrt(tf.maximum(tf.reduce_sum(tf.abs(x)**2, axis=axis, keepdims=True), eps))
+    x, inorm = tfutil.safe_cast(x, inorm)
+    return x * inorm
+
+
+def l2_normalize_real_imag(x, axis=None, eps=1e-12):
+    re, im = tf.real(x), tf.imag(x)
+    inorm = tf.rsqrt(tf.maximum(tf.reduce_sum(re**2 + im**2, axis=axis, keepdims=True), eps))
+    return tf.complex(re * inorm, im * inorm)
+
+
+def l2_normalize_complex128(x, axis=None, eps=1e-12):
+    x = tf.cast(x, tf.complex128)
+    inorm = tf.rsqrt(tf.maximum(tf.reduce_sum(tf.abs(x)**2, axis=axis, keepdims=True), eps))
+    return x * tf.cast(inorm, tf.complex128)
+
+
+VARIANTS = {'safe_cast': l2_normalize_safe_cast,
+            'complex128': l2_normalize_complex128,
+            'real_imag': l2_normalize_real_imag,
+            'tfutil': tfutil.l2_normalize}
+
+
+def tensors_bytes(ops):
+    """ Total bytes of outputs of ops (fully defined shapes only). """
+    total = 0
+    for op in ops:
+        for t in op.outputs:
+            n = t.get_shape().num_elements()
+            if n is not None:
+                total += n * t.dtype.size
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--n', type=int, default=256)
+    parser.add_argument('--m', type=int, default=4096)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    x0 = (np.random.randn(args.n, args.m) + 1j*np.random.randn(args.n, args.m)).astype('complex64')
+    config = tf.ConfigProto(device_count={'GPU': 0})
+
+    print('{:>12} {:>12} {:>12} {:>12}'.format('variant', 'out dtype', 'MB', 'ms'))
+    for name, fun in VARIANTS.items():
+        with tf.Graph().as_default() as graph:
+            x = tf.Variable(x0)
+            n_ops = len(graph.get_operations())
+            y = fun(x, axis=1)
+            mbytes = tensors_bytes(graph.get_operations()[n_ops:]) / 2**20
+            # keep the op from returning large arrays to python
+            target = tf.reduce_sum(tf.real(y)).op
+
+            with tf.Session(config=config) as sess:
+                sess.run(tf.global_variables_initializer())
+                sess.run(target)
+                t0 = time.time()
+                for _ in range(args.repeat):
+                    sess.run(target)
+                ms = (time.time() - t0) / args.repeat * 1e3
+
+        print('{:>12} {:>12} {:>12.1f} {:>12.2f}'.format(name, y.dtype.name, mbytes, ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+""" Minimal benchmark harness: parameter sweeps, timing and peak memory. """
+import itertools
+import timeit
+import tracemalloc
+
+
+def parametrize(**params):
+    """ Decorator to set parameters to sweep on benchmark.
+
+    Benchmarks are setup functions: they take one value of each parameter and
+    return a zero argument callable, which is what gets measured.
+    """
+    def decorator(fn):
+        fn.params = params
+        return fn
+    return decorator
+
+
+def param_combinations(fn):
+    """ Return list of dicts with all parameter combinations of benchmark fn. """
+    params = getattr(fn, 'params', {})
+    return [dict(zip(params.keys(), x)) for x in itertools.product(*params.values())]
+
+
+def case_name(fn, params):
+    """ Return name of benchmark case, e.g. suite_math.rotvol[n=32]. """
+    name = '{}.{}'.format(fn.__module__.split('.')[-1], fn.__name__[len('bench_'):])
+    if params:
+        name += '[{}]'.format(','.join('{}={}'.format(k, v) for k, v in params.items()))
+    return name
+
+
+def measure_time(fn, repeat=5, min_time=0.2):
+    """ Return best time per call of fn, over repeat runs of at least min_time seconds. """
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def measure_peakmem(fn):
+    """ Return peak memory (bytes) allocated during one call of fn. """
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
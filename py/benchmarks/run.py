@@ -0,0 +1,157 @@
+""" Run ce_common benchmarks, save baselines and compare runs.
+
+Usage (from py/):
+    python -m benchmarks.run [-k PATTERN] [--save NAME] [--compare NAME] [--threshold 1.2]
+    python -m benchmarks.run compare BASE NEW [--threshold 1.2]
+
+Baselines are json files on benchmarks/results/ (NAME or NAME.json). Exits
+with status 1 if any case is slower (or uses more memory) than the baseline by
+more than threshold, fails while it ran on the baseline, or is missing from the
+new run (with -k, only baseline cases matching the pattern are expected).
+"""
+import argparse
+import importlib
+import inspect
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from .harness import param_combinations, case_name, measure_time, measure_peakmem
+
+SUITES = ['suite_math', 'suite_util', 'suite_visualization']
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def run(pattern='', repeat=5, min_time=0.2):
+    """ Run benchmarks whose names contain pattern; return dict name -> results. """
+    results = {}
+    for suite in SUITES:
+        module = importlib.import_module('.' + suite, __package__)
+        for _, fn in inspect.getmembers(module, inspect.isfunction):
+            if not fn.__name__.startswith('bench_'):
+                continue
+            for params in param_combinations(fn):
+                name = case_name(fn, params)
+                if pattern not in name:
+                    continue
+                np.random.seed(0)
+                try:
+                    call = fn(**params)
+                    res = {'time': measure_time(call, repeat, min_time),
+                           'peakmem': measure_peakmem(call)}
+                except Exception as e:
+                    res = {'error': repr(e)}
+                results[name] = res
+                print_result(name, res)
+    return results
+
+
+def print_result(name, res):
+    if 'error' in res:
+        print('{:<60} ERROR {}'.format(name, res['error']))
+    else:
+        print('{:<60} {:>12.3f} ms {:>10.2f} MB'
+              .format(name, res['time'] * 1e3, res['peakmem'] / 2**20))
+
+
+def result_file(name):
+    if os.path.isfile(name):
+        return name
+    if not name.endswith('.json'):
+        name += '.json'
+    return os.path.join(RESULTS_DIR, name)
+
+
+def save(results, name):
+    fname = result_file(name)
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    meta = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.node()}
+    with open(fname, 'w') as fout:
+        json.dump({'meta': meta, 'results': results}, fout, indent=1, sort_keys=True)
+    print('Saved results to {}'.format(fname))
+
+
+def load(name):
+    with open(result_file(name)) as fin:
+        return json.load(fin)['results']
+
+
+def compare(base, new, threshold=1.2):
+    """ Print time and memory ratios new/base; return names of regressed cases.
+
+    Cases that error on new but not on base, or that are missing from new, are
+    regressions too.
+    """
+    regressions = []
+    print('{:<60} {:>10} {:>10}'.format('case', 'time', 'peakmem'))
+    for name in sorted(set(base) & set(new)):
+        b, n = base[name], new[name]
+        if 'error' in b or 'error' in n:
+            if 'error' not in b:
+                flag = 'ERROR'
+                regressions.append(name)
+            elif 'error' not in n:
+                flag = 'fixed (error on baseline)'
+            else:
+                flag = 'error (also on baseline)'
+            print('{:<60} {:>10} {:>10} {}'.format(name, '-', '-', flag))
+            continue
+        rtime = n['time'] / b['time']
+        rmem = n['peakmem'] / b['peakmem'] if b['peakmem'] > 0 else 1.
+        flags = []
+        if rtime > threshold:
+            flags.append('SLOWER')
+        elif rtime < 1 / threshold:
+            flags.append('faster')
+        if rmem > threshold:
+            flags.append('MORE MEMORY')
+        if 'SLOWER' in flags or 'MORE MEMORY' in flags:
+            regressions.append(name)
+        print('{:<60} {:>9.2f}x {:>9.2f}x {}'.format(name, rtime, rmem, ' '.join(flags)))
+
+    for name in sorted(set(base) - set(new)):
+        regressions.append(name)
+        print('{:<60} {:>10} {:>10} {}'.format(name, '-', '-', 'MISSING'))
+    print('{} regressions (beyond {}x, errors or missing)'.format(len(regressions), threshold))
+
+    return regressions
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='flag ratios new/base above this')
+    if argv and argv[0] == 'compare':
+        parser.add_argument('base')
+        parser.add_argument('new')
+        args = parser.parse_args(argv[1:])
+        regressions = compare(load(args.base), load(args.new), args.threshold)
+    else:
+        parser.add_argument('-k', '--pattern', default='', help='only run matching cases')
+        parser.add_argument('--save', help='save results as baseline with this name')
+        parser.add_argument('--compare', help='compare results with this baseline')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--min_time', type=float, default=0.2,
+                            help='min seconds per timing repeat')
+        args = parser.parse_args(argv)
+        results = run(args.pattern, args.repeat, args.min_time)
+        if args.save:
+            save(results, args.save)
+        regressions = []
+        if args.compare:
+            base = {k: v for k, v in load(args.compare).items() if args.pattern in k}
+            regressions = compare(base, results, args.threshold)
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
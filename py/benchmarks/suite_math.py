@@ -0,0 +1,32 @@
+""" Benchmarks of ce_common.math hot paths. """
+import numpy as np
+
+from ce_common import math
+
+from .harness import parametrize
+
+
+@parametrize(n=[16, 32, 64])
+def bench_rotvol(n):
+    V = (np.random.rand(n, n, n) > 0.5).astype('float32')
+    R = math.rotzyz(0.1, 0.2, 0.3)
+    p = (np.array(V.shape) - 1) / 2
+    return lambda: math.rotvol(V, R, p)
+
+
+@parametrize(n=[100, 1000], axis=[0, 1])
+def bench_softmax(n, axis):
+    x = np.random.rand(n, n)
+    return lambda: math.softmax(x, axis=axis)
+
+
+@parametrize(n=[1000, 1000000])
+def bench_absmax(n):
+    x = np.random.randn(n) + 1j*np.random.randn(n)
+    return lambda: math.absmax(x)
+
+
+@parametrize(n=[100, 1000], axis=[None, 1])
+def bench_l2_normalize(n, axis):
+    x = np.random.rand(n, n)
+    return lambda: math.l2_normalize(x, axis=axis)
@@ -0,0 +1,29 @@
+""" Benchmarks of ce_common.util hot paths. """
+import collections
+
+import numpy as np
+
+from ce_common import util
+
+from .harness import parametrize
+
+
+@parametrize(m=[1000, 100000], dims=[1, 8])
+def bench_to_timevec(m, dims):
+    tin = np.arange(m)
+    x = np.random.rand(m, dims)
+    tout = np.random.rand(m) * (m - 1)
+    return lambda: util.to_timevec(tout, x, tin)
+
+
+@parametrize(keys=[2, 4, 6], values=[3, 6])
+def bench_combine_params(keys, values):
+    params = {'k{}'.format(k): list(range(values)) for k in range(keys)}
+    return lambda: util.combine_params(params, add_runid=True)
+
+
+@parametrize(n=[10000, 1000000], rounding_mode=['insert_none', 'ignore'])
+def bench_grouper(n, rounding_mode):
+    x = range(n)
+    # consume iterator without storing it
+    return lambda: collections.deque(util.grouper(x, 7, rounding_mode), maxlen=0)
@@ -0,0 +1,15 @@
+""" Benchmarks of ce_common.visualization hot paths. """
+import numpy as np
+
+from ce_common import visualization
+
+from .harness import parametrize
+
+
+@parametrize(n=[16, 64, 256], dtype=['uint8', 'float32'])
+def bench_tile_imgs(n, dtype):
+    imgs = np.random.rand(n, 64, 64, 3)
+    imgs = (255 * imgs).astype('uint8') if dtype == 'uint8' else imgs.astype(dtype)
+    ncols = int(np.ceil(np.sqrt(n)))
+    out = visualization.tile_imgs(imgs, ncols=ncols)
+    return lambda: visualization.tile_imgs(imgs, ncols=ncols, out=out)
@@ -0,0 +1,214 @@
+""" asyncio-based subprocess execution engine """
+import os
+import time
+import signal
+import asyncio
+import subprocess
+
+
+def _killpg(proc, sig):
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+async def terminate(proc, term_timeout=10.):
+    """ Send SIGTERM to process group; escalate to SIGKILL after term_timeout seconds.
+
+    proc is an asyncio process started with start_new_session=True, so that its
+    children (which could be holding its pipes) are signaled as well.
+    """
+    if proc.returncode is None:
+        _killpg(proc, signal.SIGTERM)
+        try:
+            return await asyncio.wait_for(proc.wait(), term_timeout)
+        except asyncio.TimeoutError:
+            pass
+    _killpg(proc, signal.SIGKILL)
+
+    return await proc.wait()
+
+
+async def _read_all(stream, chunks):
+    while True:
+        chunk = await stream.read(2**16)
+        if not chunk:
+            return
+        chunks.append(chunk)
+
+
+async def run_job(cmd, env=None, logname=None, timeout=None, term_timeout=10.):
+    """ Run command as subprocess, without blocking the event loop.
+
+    Args:
+        cmd (list): program and arguments
+        env (dict): environment; inherit current if None
+        logname (str): file to write stdout/stderr to; if None, outputs are captured
+        timeout (float): seconds before terminating the job (None: no limit)
+        term_timeout (float): seconds between SIGTERM and SIGKILL
+
+    Returns:
+        subprocess.CompletedProcess, with extra attributes
+            lines (list of str): output lines
+            timed_out (bool)
+            runtime (float): seconds from start to end of job
+    """
+    t0 = time.time()
+    fout = open(logname, 'wt') if logname is not None else None
+    stdout = fout if fout is not None else asyncio.subprocess.PIPE
+    timed_out = False
+    # captured output is read incrementally, so it is kept if the job is terminated
+    chunks = []
+    reader = None
+    try:
+        proc = await asyncio.create_subprocess_exec(*cmd,
+                                                    env=env,
+                                                    stdout=stdout,
+                                                    stderr=subprocess.STDOUT,
+                                                    start_new_session=True)
+        if fout is None:
+            reader = asyncio.ensure_future(_read_all(proc.stdout, chunks))
+        try:
+            await asyncio.wait_for(proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await terminate(proc, term_timeout)
+        except asyncio.CancelledError:
+            await terminate(proc, term_timeout)
+            raise
+        finally:
+            if reader is not None:
+                # process group is dead at this point, so the pipe is closed
+                await asyncio.gather(reader, return_exceptions=True)
+    finally:
+        if fout is not None:
+            fout.close()
+
+    if logname is not None:
+        with open(logname, 'rt') as fin:
+            lines = fin.readlines()
+    else:
+        lines = b''.join(chunks).decode(errors='replace').splitlines(keepends=True)
+
+    out = subprocess.CompletedProcess(cmd, proc.returncode)
+    out.lines = lines
+    out.timed_out = timed_out
+    out.runtime = time.time() - t0
+
+    return out
+
+
+def _failed_result(cmd, error, t0):
+    """ Result of a job that could not run (e.g. command not found). """
+    out = subprocess.CompletedProcess(cmd, 127)
+    out.lines = ['{!r}\n'.format(error)]
+    out.timed_out = False
+    out.runtime = time.time() - t0
+    return out
+
+
+async def _call_hook(hook, *args):
+    if hook is not None:
+        ret = hook(*args)
+        if asyncio.iscoroutine(ret):
+            await ret
+
+
+async def run_jobs_async(jobs,
+                         slots=None,
+                         prepare=None,
+                         timeout=None,
+                         term_timeout=10.,
+                         on_start=None,
+                         on_done=None):
+    """ Run list of jobs concurrently from a single event loop.
+
+    Each job takes one of the slots while running, so there are at most len(slots)
+    jobs running at once; slots are e.g. GPU ids, or None for plain concurrency limits.
+
+    Args:
+        jobs (list of dicts): containing 'cmd' (list) and 'id' keys, and optionally
+                              'env', 'logname' and 'timeout' (overrides default)
+        slots (list): resources to run jobs on; default: one slot per job
+        prepare (callable): prepare(job, slot) -> (cmd, env); default uses job['cmd'], job.get('env')
+        timeout (float): default per-job timeout in seconds
+        term_timeout (float): seconds between SIGTERM and SIGKILL
+        on_start (callable): on_start(job, slot), called when job starts
+        on_done (callable): on_done(job, result), called as soon as job finishes
+
+    Hooks may be plain functions or coroutine functions.
+
+    A job that cannot be started (or whose prepare/on_start hook raises) gets
+    returncode 127, with the error as its only output line; errors in on_done
+    are printed and appended to the job's lines. Other jobs are not affected.
+
+    Returns:
+        dict id -> CompletedProcess (see run_job), also with attribute
+            queue_wait (float): seconds the job waited for a slot
+    """
+    t0 = time.time()
+    if slots is None:
+        slots = [None] * max(len(jobs), 1)
+    if prepare is None:
+        def prepare(job, slot):
+            return job['cmd'], job.get('env')
+
+    free = asyncio.Queue()
+    for s in slots:
+        free.put_nowait(s)
+
+    out = {}
+
+    async def worker(job):
+        slot = await free.get()
+        queue_wait = time.time() - t0
+        cmd = job.get('cmd')
+        try:
+            cmd, env = prepare(job, slot)
+            await _call_hook(on_start, job, slot)
+            result = await run_job(cmd,
+                                   env=env,
+                                   logname=job.get('logname'),
+                                   timeout=job.get('timeout', timeout),
+                                   term_timeout=term_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # e.g. command not found; fail this job only
+            result = _failed_result(cmd, e, t0 + queue_wait)
+        finally:
+            free.put_nowait(slot)
+        result.queue_wait = queue_wait
+        out[job['id']] = result
+        try:
+            await _call_hook(on_done, job, result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print('on_done failed for job {}: {!r}'.format(job['id'], e))
+            result.lines.append('on_done: {!r}\n'.format(e))
+
+    tasks = [asyncio.ensure_future(worker(j)) for j in jobs]
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        # on cancellation, make sure no child processes are left behind
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    return out
+
+
+def run_jobs(jobs, **kwargs):
+    """ Blocking version of run_jobs_async; see its docs for arguments.
+
+    Examples:
+    >>> out = run_jobs([{'id': 'a', 'cmd': ['echo', 'hi']},
+    ...                 {'id': 'b', 'cmd': ['false']}])
+    >>> out['a'].returncode, out['a'].lines, out['b'].returncode
+    (0, ['hi\\n'], 1)
+    """
+    return asyncio.run(run_jobs_async(jobs, **kwargs))
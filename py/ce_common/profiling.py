@@ -0,0 +1,203 @@
+""" Opt-in timing instrumentation
+
+Record call counts, wall/cpu time histograms and allocated bytes per function.
+Nothing is recorded unless profiling is enabled (see profile, enable).
+
+Examples:
+>>> from ce_common import math
+>>> with profile(math) as stats:
+...     _ = math.rotvol(np.zeros((8, 8, 8)), math.rotx(0.1))
+>>> stats['ce_common.math.rotvol'].calls
+1
+"""
+import functools
+import inspect
+import json
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+# global state; see enable/disable
+_state = {'enabled': False, 'memory': False, 'started_tracemalloc': False}
+_stats = {}
+# guards _stats; calls may be recorded from several threads (e.g. tfutil.dispatch)
+_lock = threading.Lock()
+
+
+def _log2_bin(seconds):
+    """ Histogram bin k of a duration in [2**(k-1), 2**k) us. """
+    return int(np.ceil(np.log2(max(seconds * 1e6, 1.))))
+
+
+def _hist_dict(hist):
+    return {'<{}'.format(2**k): v for k, v in sorted(hist.items())}
+
+
+class Stats:
+    """ Statistics of calls to one function. """
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.
+        self.cpu = 0.
+        self.bytes = 0
+        # histograms of wall and cpu times; bin k counts calls taking [2**(k-1), 2**k) us
+        self.hist = {}
+        self.cpu_hist = {}
+
+    def add(self, wall, cpu=0., nbytes=0):
+        self.calls += 1
+        self.wall += wall
+        self.cpu += cpu
+        self.bytes += nbytes
+        k = _log2_bin(wall)
+        self.hist[k] = self.hist.get(k, 0) + 1
+        k = _log2_bin(cpu)
+        self.cpu_hist[k] = self.cpu_hist.get(k, 0) + 1
+
+    def as_dict(self):
+        return {'calls': self.calls,
+                'wall': self.wall,
+                'cpu': self.cpu,
+                'bytes': self.bytes,
+                'wall_hist_us': _hist_dict(self.hist),
+                'cpu_hist_us': _hist_dict(self.cpu_hist)}
+
+
+def enable(memory=False):
+    """ Start recording; if memory, also trace allocated bytes (slower). """
+    _state.update(enabled=True, memory=memory)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _state['started_tracemalloc'] = True
+
+
+def disable():
+    """ Stop recording; tracemalloc is only stopped if enable started it. """
+    if _state['started_tracemalloc'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _state.update(enabled=False, memory=False, started_tracemalloc=False)
+
+
+def is_enabled():
+    return _state['enabled']
+
+
+def reset():
+    """ Clear recorded statistics. """
+    with _lock:
+        _stats.clear()
+
+
+def stats():
+    """ Return dict name -> Stats of recorded calls. """
+    return _stats
+
+
+def record(name, wall, cpu=0., nbytes=0):
+    """ Add measurement to statistics of name (if profiling is enabled). """
+    if _state['enabled']:
+        with _lock:
+            if name not in _stats:
+                _stats[name] = Stats(name)
+            _stats[name].add(wall, cpu, nbytes)
+
+
+def _instrument(fn, name):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _state['enabled']:
+            return fn(*args, **kwargs)
+        memory = _state['memory'] and tracemalloc.is_tracing()
+        if memory:
+            mem0 = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        t0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            wall, cpu = time.perf_counter() - t0, time.thread_time() - c0
+            # approximate for nested instrumented calls, which reset the peak
+            nbytes = tracemalloc.get_traced_memory()[1] - mem0 if memory else 0
+            record(name, wall, cpu, max(nbytes, 0))
+    wrapper.__instrumented__ = fn
+    return wrapper
+
+
+def timed(fn=None, name=None):
+    """ Decorator to record calls of fn when profiling is enabled.
+
+    When disabled, the overhead is one dict lookup per call.
+    """
+    if fn is None:
+        return functools.partial(timed, name=name)
+    return _instrument(fn, name or '{}.{}'.format(fn.__module__, fn.__qualname__))
+
+
+def _public_functions(module):
+    """ Return public functions defined on module (coroutine functions are skipped). """
+    return {k: v for k, v in vars(module).items()
+            if inspect.isfunction(v) and not inspect.iscoroutinefunction(v)
+            and not k.startswith('_') and v.__module__ == module.__name__}
+
+
+class profile:
+    """ Context manager that records calls to public functions of modules.
+
+    Functions are only wrapped inside the context, so there is no overhead
+    otherwise. Calls through names imported before entering the context
+    (from module import fun) are not recorded.
+
+    Previous statistics are cleared on entering.
+
+    Args:
+        modules: modules to instrument; default: ce_common math, util, visualization, tfutil and jobs
+        memory (bool): trace allocated bytes
+    """
+    def __init__(self, *modules, memory=False):
+        if not modules:
+            from . import math, util, visualization, tfutil, jobs
+            modules = [math, util, visualization, tfutil, jobs]
+        self.modules = modules
+        self.memory = memory
+
+    def __enter__(self):
+        self.originals = []
+        for m in self.modules:
+            for k, fn in _public_functions(m).items():
+                if not hasattr(fn, '__instrumented__'):
+                    self.originals.append((m, k, fn))
+                    setattr(m, k, _instrument(fn, '{}.{}'.format(m.__name__, k)))
+        reset()
+        enable(self.memory)
+        return _stats
+
+    def __exit__(self, type, value, traceback):
+        disable()
+        for m, k, fn in self.originals:
+            setattr(m, k, fn)
+
+
+def summary(sort='wall'):
+    """ Return table of recorded statistics, sorted by total wall time (or calls, cpu, bytes). """
+    with _lock:
+        rows = sorted(_stats.values(), key=lambda s: getattr(s, sort), reverse=True)
+    out = '{:<50} {:>8} {:>12} {:>12} {:>12} {:>10}\n'.format(
+        'function', 'calls', 'wall (ms)', 'mean (ms)', 'cpu (ms)', 'MB')
+    for s in rows:
+        out += '{:<50} {:>8} {:>12.3f} {:>12.3f} {:>12.3f} {:>10.2f}\n'.format(
+            s.name, s.calls, s.wall * 1e3, s.wall / s.calls * 1e3, s.cpu * 1e3, s.bytes / 2**20)
+    return out
+
+
+def to_json(fname=None):
+    """ Return recorded statistics as json string; also write to fname if given. """
+    with _lock:
+        out = {k: v.as_dict() for k, v in _stats.items()}
+    out = json.dumps(out, indent=1, sort_keys=True)
+    if fname is not None:
+        with open(fname, 'w') as fout:
+            fout.write(out)
+    return out
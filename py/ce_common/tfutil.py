@@ -1,5 +1,6 @@
 """ tensorflow utilities """
 import os
+import asyncio
 import subprocess
 import pickle
 import queue
@@ -9,21 +10,195 @@ import time
 import webbrowser
 
 import numpy as np
-import tensorflow as tf
+
+from . import util
+from . import jobs
+from . import profiling
+
+tf = util.lazy_import('tensorflow')
 
 
 def count_weights(print_perlayer=True):
     """ Count number of trainable variables on current tf graph. """
-    acc_total = 0
-    for v in tf.trainable_variables():
-        dims = v.get_shape().as_list()
-        total = np.prod(dims)
-        acc_total += total
-        if print_perlayer:
-            print('{}: {}, {}'.format(v.name, dims, total))
-    print('Accumulated total: {}'.format(acc_total))
+    prof = profile_model(flops=False)
+    if print_perlayer:
+        for v in prof.layers:
+            print('{}: {}, {}'.format(v.name, v.shape[0], v.params))
+    print('Accumulated total: {}'.format(prof.params))
+
+    return prof.params
+
+
+def _weights_profile(name, weights):
+    """ Profile list of variables; return AttrDict with shapes, params and bytes. """
+    out = util.AttrDict(name=name, shape=[], params=0, bytes=0, bytes_by_dtype={},
+                        flops=None, activation_bytes=None)
+    for w in weights:
+        dims = w.get_shape().as_list()
+        n = int(np.prod(dims))
+        dtype = w.dtype.base_dtype
+        out.shape.append(dims)
+        out.params += n
+        out.bytes += n * dtype.size
+        out.bytes_by_dtype[dtype.name] = out.bytes_by_dtype.get(dtype.name, 0) + n * dtype.size
+
+    return out
+
+
+def _channels(layer, shape):
+    """ Number of channels of shape, given the data_format of layer. """
+    axis = 1 if getattr(layer, 'data_format', None) == 'channels_first' else -1
+    return tf.compat.dimension_value(shape[axis])
+
+
+def _is_transposed_conv(layer):
+    names = ['Conv1DTranspose', 'Conv2DTranspose', 'Conv3DTranspose']
+    classes = tuple(getattr(tf.keras.layers, n) for n in names if hasattr(tf.keras.layers, n))
+    return isinstance(layer, classes)
+
+
+def _layer_flops(layer, in_shape, out_shape):
+    """ Estimate FLOPs of keras layer given its input and output shapes.
+
+    Counts one multiply-add per kernel entry per position, plus bias, for
+    Dense/ConvND (output positions), transposed convs (input positions),
+    DepthwiseConv and SeparableConv. Returns None for recurrent layers; other
+    layers (activations, pooling, merges, normalization) are counted as one op
+    per output.
+    """
+    n_out = out_shape.num_elements()
+    bias = n_out if getattr(layer, 'bias', None) is not None else 0
+    depthwise = getattr(layer, 'depthwise_kernel', None)
+    if depthwise is not None:
+        # depthwise: one kernel window per (output position, channel * multiplier)
+        kh_kw = int(np.prod(depthwise.get_shape().as_list()[:-2]))
+        pointwise = getattr(layer, 'pointwise_kernel', None)
+        if pointwise is None:
+            return 2 * kh_kw * n_out + bias
+        n_pos = n_out // _channels(layer, out_shape)
+        n_mid = n_pos * tf.compat.dimension_value(pointwise.get_shape()[-2])
+        return 2 * kh_kw * n_mid + 2 * pointwise.get_shape().num_elements() * n_pos + bias
+
+    kernel = getattr(layer, 'kernel', None)
+    if kernel is not None:
+        if _is_transposed_conv(layer):
+            n_pos = in_shape.num_elements() // _channels(layer, in_shape)
+        else:
+            n_pos = n_out // _channels(layer, out_shape)
+        return 2 * kernel.get_shape().num_elements() * n_pos + bias
+
+    if hasattr(layer, 'cell') or hasattr(layer, 'forward_layer'):
+        # recurrent (or Bidirectional): cost depends on the cell and sequence length
+        return None
+    return n_out
+
+
+def _built_shapes(shape, batch):
+    """ List of TensorShapes from keras (list of) shapes, with batch substituted for None. """
+    if not isinstance(shape, list):
+        shape = [shape]
+    out = []
+    for s in shape:
+        s = tf.TensorShape(s)
+        if s.ndims and tf.compat.dimension_value(s[0]) is None:
+            s = tf.TensorShape([batch]).concatenate(s[1:])
+        if not s.is_fully_defined():
+            raise ValueError('Layer shapes must be fully defined (except batch): {}'.format(s))
+        out.append(s)
+    return out
+
 
-    return acc_total
+def profile_model(model=None, input_shape=None, trainable_only=True, flops=True):
+    """ Return parameter count, bytes and estimated FLOPs, per variable/layer and in total.
+
+    Graph mode (model is None) profiles each variable on the default graph;
+    total FLOPs come from tf.profiler, so shapes must be fully defined.
+    Keras mode profiles each layer of model; FLOPs and activation memory are only
+    estimated when input_shape is given, from the input/output shapes each layer
+    was built with (so functional models with branches are handled). Layers whose
+    FLOPs cannot be estimated (see _layer_flops) are listed in flops_unsupported
+    and left out of the total.
+
+    Args:
+        model (tf.keras.Model): model to profile; if None, use default graph
+        input_shape (tuple): input shape including batch dimension (keras only);
+                             builds the model if needed; a None batch is taken as 1
+        trainable_only (bool): only count trainable variables
+        flops (bool): estimate FLOPs
+
+    Returns:
+        AttrDict with keys
+            layers (list of AttrDict): per variable/layer name, shape (list of weight shapes),
+                                       params, bytes, bytes_by_dtype, flops, activation_bytes
+            params, bytes, bytes_by_dtype, flops: totals
+            flops_unsupported (list): names of layers not counted in flops
+            peak_activation_bytes: max over layers of input + output activation bytes
+    """
+    layers = []
+    total_flops = None
+    peak_act = None
+    unsupported = []
+    if model is None:
+        variables = tf.trainable_variables() if trainable_only else tf.global_variables()
+        layers = [_weights_profile(v.name, [v]) for v in variables]
+        if flops:
+            opts = (tf.profiler.ProfileOptionBuilder(
+                tf.profiler.ProfileOptionBuilder.float_operation())
+                    .with_empty_output()
+                    .build())
+            total_flops = tf.profiler.profile(tf.get_default_graph(),
+                                              options=opts).total_float_ops
+    else:
+        batch = 1
+        if input_shape is not None:
+            input_shape = tuple(input_shape)
+            if not model.built:
+                model.build((None,) + input_shape[1:])
+            batch = input_shape[0] or 1
+        estimate = input_shape is not None
+        if estimate:
+            total_flops, peak_act = 0, 0
+        for layer in model.layers:
+            if isinstance(layer, tf.keras.layers.InputLayer):
+                continue
+            weights = layer.trainable_weights if trainable_only else layer.weights
+            prof = _weights_profile(layer.name, weights)
+            if estimate:
+                # shapes the layer was built with, so branches and merges are handled
+                try:
+                    in_shapes = _built_shapes(layer.input_shape, batch)
+                    out_shapes = _built_shapes(layer.output_shape, batch)
+                except AttributeError:
+                    # layer not connected, or shared with different shapes
+                    unsupported.append(layer.name)
+                    layers.append(prof)
+                    continue
+                size = tf.as_dtype(layer.dtype or 'float32').size
+                in_act = sum(s.num_elements() for s in in_shapes) * size
+                prof.activation_bytes = sum(s.num_elements() for s in out_shapes) * size
+                peak_act = max(peak_act, in_act + prof.activation_bytes)
+                if flops:
+                    prof.flops = _layer_flops(layer, in_shapes[0], out_shapes[0])
+                    if prof.flops is None:
+                        unsupported.append(layer.name)
+                    else:
+                        total_flops += prof.flops
+            layers.append(prof)
+        if not flops:
+            total_flops = None
+
+    out = util.AttrDict(layers=layers,
+                        params=sum(l.params for l in layers),
+                        bytes=sum(l.bytes for l in layers),
+                        bytes_by_dtype={},
+                        flops=total_flops,
+                        flops_unsupported=unsupported,
+                        peak_activation_bytes=peak_act)
+    for l in layers:
+        for k, v in l.bytes_by_dtype.items():
+            out.bytes_by_dtype[k] = out.bytes_by_dtype.get(k, 0) + v
+
+    return out
 
 
 def tf_config():
@@ -68,23 +243,113 @@ def run_tensorboard(logdirs, ids=None, port=6123, host=None):
 def safe_cast(x, y):
     """ Cast x to type of y or y to type of x, without loss of precision.
 
-    Works with complex and floats of any precision
+    Works with complex and floats of any precision; precision is that of the
+    wider real component (complex64 and float64 give complex128).
     """
-    t = 'complex' if (x.dtype.is_complex or y.dtype.is_complex) else 'float'
-    s = max(x.dtype.size, y.dtype.size)
-    dtype = '{}{}'.format(t, s*8)
+    bits = 8 * max(x.dtype.real_dtype.size, y.dtype.real_dtype.size)
+    dtype = tf.as_dtype('float{}'.format(bits))
+    if x.dtype.is_complex or y.dtype.is_complex:
+        dtype = complex_dtype(dtype)
 
     return tf.cast(x, dtype), tf.cast(y, dtype)
 
 
+def numpy_dataset(arrays,
+                  batch_size,
+                  shuffle=True,
+                  block_size=1024,
+                  shuffle_buffer=None,
+                  map_fn=None,
+                  num_parallel_calls=4,
+                  cache=None,
+                  prefetch=1,
+                  drop_remainder=False):
+    """ Make a batched tf.data.Dataset from numpy arrays or np.memmap files.
+
+    Arrays are read in contiguous blocks of block_size rows, so memmaps are read
+    sequentially and never fully loaded. Shuffling is block-wise: block order is
+    permuted every epoch, and a shuffle buffer mixes examples across blocks.
+    With cache, block order is frozen after the first epoch (only the buffer shuffles).
+
+    Args:
+        arrays (array or list of arrays): inputs, all with the same first dimension
+        batch_size (int):
+        shuffle (bool):
+        block_size (int): number of rows read at once
+        shuffle_buffer (int): examples on shuffle buffer; default block_size
+        map_fn (callable): applied to each example, e.g. augmentations; see py_map
+        num_parallel_calls (int): for map_fn
+        cache (str or None): cache examples (before shuffling and map_fn) in memory
+                             if '', or on this file otherwise
+        prefetch (int): number of batches to prefetch
+        drop_remainder (bool): drop last batch if smaller than batch_size
+
+    Returns:
+        tf.data.Dataset; call .repeat() on it for multiple epochs
+    """
+    single = not isinstance(arrays, (list, tuple))
+    if single:
+        arrays = [arrays]
+    n = len(arrays[0])
+    assert all(len(a) == n for a in arrays)
+
+    def blocks():
+        starts = np.arange(0, n, block_size)
+        if shuffle:
+            starts = np.random.permutation(starts)
+        for i in starts:
+            out = tuple(np.asarray(a[i:i+block_size]) for a in arrays)
+            yield out[0] if single else out
+
+    dtypes = tuple(tf.as_dtype(a.dtype) for a in arrays)
+    shapes = tuple(tf.TensorShape([None] + list(a.shape[1:])) for a in arrays)
+    if single:
+        dtypes, shapes = dtypes[0], shapes[0]
+
+    ds = (tf.data.Dataset.from_generator(blocks, dtypes, shapes)
+          .apply(tf.data.experimental.unbatch()))
+    if cache is not None:
+        ds = ds.cache(cache)
+    if shuffle:
+        ds = ds.shuffle(shuffle_buffer or block_size)
+    if map_fn is not None:
+        ds = ds.map(map_fn, num_parallel_calls=num_parallel_calls)
+    ds = ds.batch(batch_size, drop_remainder=drop_remainder)
+
+    return ds.prefetch(prefetch)
+
+
+def py_map(fn, dtypes=None):
+    """ Wrap numpy function fn to be used as numpy_dataset map_fn (e.g. math.rotvol).
+
+    fn takes the components of an example and must return arrays with the same
+    shapes, and same dtypes unless given. Note that fn holds the GIL.
+    """
+    def wrapper(*args):
+        out = tf.py_func(fn, list(args), dtypes or [a.dtype for a in args])
+        for o, a in zip(out, args):
+            o.set_shape(a.get_shape())
+        return out[0] if len(out) == 1 else tuple(out)
+
+    return wrapper
+
+
 def dispatch(params,
              outfile,
              regexp='',
              gpus=[0, 1, 2, 3],
              verbose=False,
-             tensorboard_port=None):
+             tensorboard_port=None,
+             resume=False,
+             engine='threads',
+             timeout=None):
     """ Dispatch list of training jobs.
 
+    Results of each job are appended to a journal (outfile + '.journal') as soon as
+    the job finishes, so they are not lost if the dispatcher dies. Use
+    load_results to read them back. Results have queue_wait and runtime
+    attributes (seconds), also recorded by ce_common.profiling when enabled.
+
     Args:
         params (list of dicts): containing 'cmd', 'id', 'logdir' keys
         outfile (str): file to save results to
@@ -94,63 +359,103 @@ def dispatch(params,
         verbose (bool):
         tensorboard_port (int): port to run tensorboard locally (if not None);
                                 we assume some sort of log synchronization is running on background
+        resume (bool): skip jobs recorded as successful on the journal of a previous run;
+                       otherwise the journal is restarted
+        engine (str): 'threads' (one thread per GPU, blocking on subprocess.run) or
+                      'asyncio' (all jobs monitored from one event loop; see ce_common.jobs)
+        timeout (float): seconds before terminating each job, 'asyncio' engine only;
+                         a 'timeout' entry in params overrides it
     """
+    fname = os.path.expanduser(outfile)
+    journal = journal_name(fname)
+    os.makedirs(os.path.split(fname)[0], exist_ok=True)
+
+    out = {}
+    if resume and os.path.isfile(journal):
+        # drop any record truncated by a crash before appending to the journal
+        util.load_pickles(journal, truncate=True)
+        out = {k: v for k, v in load_results(fname, journal_only=True)['out'].items()
+               if v.returncode == 0}
+        print('Resuming; skipping {} finished jobs'.format(len(out)))
+    elif os.path.isfile(journal):
+        os.remove(journal)
+    journal_lock = threading.Lock()
 
     q = queue.Queue()
     for p in params:
-        q.put(p)
+        if p['id'] not in out:
+            q.put(p)
+
+    t0 = time.time()
+    print("Starting queue of {} jobs on {} GPUs".format(q.qsize(), len(gpus)))
+    print('\n'.join(['{}: {}'.format(p['id'], p['cmd']) for p in q.queue]))
+
+    def job_cmd(p, gpu):
+        """ Return command and environment to run job p on gpu. """
+        if isinstance(gpu, list):
+            cmd = ('ssh {} source ~/.profile; CUDA_VISIBLE_DEVICES={} python3 {}'
+                   .format(gpu[0], gpu[1], p['cmd']).split(' '))
+            env = None
+        else:
+            cmd = ('python3 {}'.format(p['cmd']).split(' '))
+            env = os.environ.copy()
+            env['CUDA_VISIBLE_DEVICES'] = str(gpu)
+
+        # print(cmd)
+        # note: if set env=CUDA_VISIBLE_DEVICES when running remotely, ssh-keys won't work
+        return cmd, env
+
+    def job_logname(p):
+        logdir = os.path.expanduser(p['logdir'])
+        os.makedirs(logdir, exist_ok=True)
+        return '{}/{}.log'.format(logdir, p['id'])
+
+    def report(p, result):
+        """ Store result of job p, print its errors and matching lines. """
+        out[p['id']] = result
+        lines = result.lines
+        rc = result.returncode
+        if rc != 0:
+            # TODO: add errors back to queue?
+            #       doesn't soound like a great idea, some errors are harmless
+            errmsg = ''
+            for l in lines:
+                if ('Error' in l) or (verbose):
+                    errmsg += l
+            if errmsg:
+                print('{} returned {}. (possible error)\n{}'
+                      .format(p['id'], rc, errmsg))
 
-    print("Starting queue of {} jobs on {} GPUs".format(len(params), len(gpus)))
-    print('\n'.join(['{}: {}'.format(p['id'], p['cmd']) for p in params]))
+        for l in lines:
+            m = re.match(regexp, l)
+            if m:
+                print(m.string, end='')
 
-    out = {}
+        profiling.record('ce_common.tfutil.dispatch.queue_wait', result.queue_wait)
+        profiling.record('ce_common.tfutil.dispatch.runtime', result.runtime)
+
+        with journal_lock:
+            util.append_pickle(journal, {'params': p, 'out': result})
 
     def process(gpu, q):
         """ Thread to initiate training processes. """
         while not q.empty():
             p = q.get()
-            if isinstance(gpu, list):
-                cmd = ('ssh {} source ~/.profile; CUDA_VISIBLE_DEVICES={} python3 {}'
-                       .format(gpu[0], gpu[1], p['cmd']).split(' '))
-                env = None
-            else:
-                cmd = ('python3 {}'.format(p['cmd']).split(' '))
-                env = os.environ.copy()
-                env['CUDA_VISIBLE_DEVICES'] = str(gpu)
-
-            # print(cmd)
-            # note: if set env=CUDA_VISIBLE_DEVICES when running remotely, ssh-keys won't work
-            logdir = os.path.expanduser(p['logdir'])
-            logname = '{}/{}.log'.format(logdir, p['id'])
-            os.makedirs(logdir, exist_ok=True)
+            cmd, env = job_cmd(p, gpu)
+            logname = job_logname(p)
+            tstart = time.time()
             with open(logname, 'wt') as fout:
-                out[p['id']] = subprocess.run(cmd,
-                                              env=env,
-                                              stdout=fout,
-                                              stderr=fout)
+                result = subprocess.run(cmd,
+                                        env=env,
+                                        stdout=fout,
+                                        stderr=fout)
+            result.queue_wait = tstart - t0
+            result.runtime = time.time() - tstart
             with open(logname, 'rt') as fin:
-                lines = fin.readlines()
-
-            rc = out[p['id']].lines = lines
-            rc = out[p['id']].returncode
-            if rc != 0:
-                # TODO: add errors back to queue?
-                #       doesn't soound like a great idea, some errors are harmless
-                errmsg = ''
-                for l in lines:
-                    if ('Error' in l) or (verbose):
-                        errmsg += l
-                if errmsg:
-                    print('{} returned {}. (possible error)\n{}'
-                          .format(p['id'], out[p['id']].returncode, errmsg))
-
-            for l in lines:
-                m = re.match(regexp, l)
-                if m:
-                    print(m.string, end='')
+                result.lines = fin.readlines()
 
-        # CHECKME !!!
-        q.task_done()
+            report(p, result)
+            q.task_done()
 
     def manage_tb(entries, q, tsleep=30):
         """ Thread to manage tensorboard.
@@ -172,38 +477,155 @@ def dispatch(params,
                                 port=tensorboard_port)
                 prev_qsize = curr_qsize
 
-    if tensorboard_port is not None:
-        tbt = threading.Thread(target=manage_tb, args=[params, q])
-        tbt.daemon = True
-        tbt.start()
-
-    threads = []
-
-    for gpu in gpus:
-        t = threading.Thread(target=process, args=[gpu, q])
-        t.daemon = True
-        t.start()
-        threads.append(t)
-
-    # join all threads
-    for t in threads:
-        t.join()
+    if engine == 'asyncio':
+        started = [p for p in params if p['id'] in out]
+        tb_pending = []
+
+        def restart_tb():
+            tb_pending.clear()
+            run_tensorboard([p['logdir'] for p in started],
+                            [p['id'] for p in started],
+                            port=tensorboard_port)
+
+        def on_start(job, gpu):
+            """ Rerun tensorboard shortly after jobs start (once per burst of starts). """
+            started.append(job['params'])
+            if tensorboard_port is not None and not tb_pending:
+                # wait a few seconds to make sure new runs are properly initiated
+                tb_pending.append(asyncio.get_event_loop().call_later(5, restart_tb))
+
+        joblist = []
+        for p in q.queue:
+            job = {'id': p['id'], 'params': p, 'logname': job_logname(p)}
+            if 'timeout' in p:
+                job['timeout'] = p['timeout']
+            joblist.append(job)
+
+        jobs.run_jobs(joblist,
+                      slots=gpus,
+                      prepare=lambda job, gpu: job_cmd(job['params'], gpu),
+                      timeout=timeout,
+                      on_start=on_start,
+                      on_done=lambda job, result: report(job['params'], result))
+        if tb_pending:
+            # loop exited before the scheduled restart; show the last runs anyway
+            restart_tb()
+    elif engine == 'threads':
+        if tensorboard_port is not None:
+            tbt = threading.Thread(target=manage_tb, args=[params, q])
+            tbt.daemon = True
+            tbt.start()
+
+        threads = []
+
+        for gpu in gpus:
+            t = threading.Thread(target=process, args=[gpu, q])
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        # join all threads
+        for t in threads:
+            t.join()
+    else:
+        raise ValueError('Unknown engine: {}'.format(engine))
 
     # save results
-    # TODO: write function to load these results!
-    fname = os.path.expanduser(outfile)
-    os.makedirs(os.path.split(fname)[0], exist_ok=True)
     with open(fname, 'wb') as fout:
         print('Saving results to {}'.format(fname))
         pickle.dump({'params': params, 'out': out}, fout)
 
     return out
-def check_complex(x, msg):
-    """ Run check_numerics on complex values. """
-    r = tf.check_numerics(tf.real(x), msg + ' real')
-    c = tf.check_numerics(tf.imag(x), msg + ' imag')
 
-    return tf.complex(r, c)
+
+def journal_name(outfile):
+    """ Return name of journal file written by dispatch. """
+    return os.path.expanduser(outfile) + '.journal'
+
+
+def load_results(outfile, journal_only=False):
+    """ Load results saved by dispatch.
+
+    Reads the final results file if it exists; else (or if journal_only)
+    recovers whatever was recorded on the journal of a (possibly interrupted) run.
+    When a job appears more than once on the journal, the last record is kept.
+
+    Returns:
+        dict with keys 'params' (list of dicts) and 'out' (dict id -> CompletedProcess)
+    """
+    fname = os.path.expanduser(outfile)
+    if os.path.isfile(fname) and not journal_only:
+        with open(fname, 'rb') as fin:
+            return pickle.load(fin)
+
+    params, out = {}, {}
+    for r in util.load_pickles(journal_name(fname)):
+        params[r['params']['id']] = r['params']
+        out[r['params']['id']] = r['out']
+
+    return {'params': list(params.values()), 'out': out}
+
+
+# global numerics checking mode; see set_numerics_check
+_numerics_check = {'mode': 'always', 'every': 100}
+
+
+def set_numerics_check(mode='always', every=100):
+    """ Set mode of check_finite/check_complex.
+
+    Read at graph construction time, so it affects ops created afterwards.
+
+    Args:
+        mode (str): 'off': checks are identity (no ops are added)
+                    'sampled': check only when global step is a multiple of every
+                    'always': check on every run
+        every (int): sampling period for 'sampled' mode
+    """
+    if mode not in ['off', 'sampled', 'always']:
+        raise ValueError('Unknown numerics check mode: {}'.format(mode))
+    _numerics_check.update(mode=mode, every=every)
+
+
+def _check_numerics(x, msg):
+    """ tf.check_numerics on x; complex x is viewed as (real, imag) pairs (no copy). """
+    if x.dtype.is_complex:
+        x = tf.bitcast(x, real_dtype(x.dtype))
+    return tf.check_numerics(x, msg)
+
+
+def check_finite(x, msg):
+    """ Check that real or complex x has no NaN or Inf; see set_numerics_check.
+
+    Real and imaginary parts are checked at once, with a single check_numerics
+    on a bitcast view of x. Returns x with a control dependency on the check.
+    In 'sampled' mode, the check only runs on sampled steps.
+    """
+    mode = _numerics_check['mode']
+    if mode == 'off':
+        return x
+
+    if mode == 'sampled':
+        step = tf.train.get_global_step()
+        if step is None:
+            raise ValueError('Sampled numerics check requires a global step')
+
+        def checked():
+            with tf.control_dependencies([_check_numerics(x, msg)]):
+                return tf.constant(True)
+
+        check = tf.cond(tf.equal(step % _numerics_check['every'], 0),
+                        checked,
+                        lambda: tf.constant(False))
+    else:
+        check = _check_numerics(x, msg)
+
+    with tf.control_dependencies([check]):
+        return tf.identity(x)
+
+
+def check_complex(x, msg):
+    """ Run check_numerics on complex values. See check_finite. """
+    return check_finite(x, msg)
 
 
 def tensorboard_curr_graph():
@@ -218,13 +640,44 @@ def tensorboard_curr_graph():
     webbrowser.open('http://localhost:6006')    
 
 
+def real_dtype(dtype):
+    """ Return real dtype with same precision as dtype (complex64 -> float32). """
+    return tf.as_dtype(dtype).real_dtype
+
+
+def complex_dtype(dtype):
+    """ Return complex dtype with same precision as dtype (float32 -> complex64). """
+    dtype = tf.as_dtype(dtype)
+    if dtype.is_complex:
+        return dtype
+    return tf.complex128 if dtype == tf.float64 else tf.complex64
+
+
+def abs2(x):
+    """ Returns |x|**2, keeping the precision of x (complex64 -> float32).
+
+    Unlike tf.abs(x)**2, does not take a square root just to undo it.
+    """
+    if x.dtype.is_complex:
+        return tf.real(x)**2 + tf.imag(x)**2
+    return x**2
+
+
+def complex_scale(x, s):
+    """ Multiply x by real s in the dtype of x (s is cast; x is never promoted). """
+    return x * tf.cast(s, x.dtype)
+
+
 def norm2(x, *args, **kwargs):
-    """ Returns l2-norm squared. """
-    return tf.reduce_sum(x**2, *args, **kwargs)
+    """ Returns l2-norm squared; real valued, with the precision of x, for complex x. """
+    return tf.reduce_sum(abs2(x), *args, **kwargs)
 
 
 def l2_normalize(x, axis=None, eps=1e-12):
-    """ Same as tf.nn.l2_normalize, but also works with complex values. """
+    """ Same as tf.nn.l2_normalize, but also works with complex values.
+
+    Complex inputs keep their dtype (complex64 stays complex64); the norm has
+    the real dtype of x, so casting it back is exact.
+    """
     inorm = tf.rsqrt(tf.maximum(tf.reduce_sum(tf.abs(x)**2, axis=axis, keepdims=True), eps))
-    x, inorm = safe_cast(x, inorm)
-    return x * inorm
+    return x * tf.cast(inorm, x.dtype)
@@ -1,10 +1,14 @@
+import os
+import sys
+import types
+import pickle
+import importlib
 import itertools
 import threading
 import functools
 from copy import deepcopy
 
 import numpy as np
-import scipy.interpolate
 
 
 class AttrDict(dict):
@@ -17,6 +21,36 @@ class AttrDict(dict):
         self.__dict__ = self
 
 
+class LazyModule(types.ModuleType):
+    """ Module that is only imported on first attribute access.
+
+    Attributes only probed by introspection (e.g. doctest looks for __wrapped__)
+    do not trigger the import. See also: lazy_import.
+    """
+    _probes = {'__wrapped__'}
+
+    def __getattr__(self, attr):
+        if attr in self._probes and self.__name__ not in sys.modules:
+            raise AttributeError(attr)
+        module = importlib.import_module(self.__name__)
+        # next lookups won't go through __getattr__
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """ Return module name, to be imported on first use.
+
+    Useful for heavy dependencies that are only needed by a few functions.
+
+    Examples:
+    >>> json = lazy_import('json')
+    >>> json.dumps([1])
+    '[1]'
+    """
+    return LazyModule(name)
+
+
 class temp_nprandom_state:
     def __init__(self, seed=0):
         self.seed = seed
@@ -123,10 +157,12 @@ def to_timevec(tout, x, tin, kind='linear'):
         x (m x l): input time series
         tin (m x 1): input time
     """
+    import scipy.interpolate
+
     if x.ndim == 1:
         x = x[..., np.newaxis]
 
-    out = [scipy.interpolate.interpolate.interp1d(tin, xdim, kind=kind)(tout)
+    out = [scipy.interpolate.interp1d(tin, xdim, kind=kind)(tout)
            for xdim in x.transpose()]
 
     return np.squeeze(np.array(out).T)
@@ -291,3 +327,42 @@ def lru_cache_copy(maxsize=128, typed=False):
             return deepcopy(cached_func(*args, **kwargs))
         return wrapper
     return decorator
+
+
+def append_pickle(fname, obj):
+    """ Append obj to a file of concatenated pickles, flushing it to disk.
+
+    Each call writes one self-contained record, so a file written this way
+    survives a crash of the writer (at worst, the last record is truncated).
+    See also: load_pickles.
+    """
+    with open(fname, 'ab') as fout:
+        pickle.dump(obj, fout)
+        fout.flush()
+        os.fsync(fout.fileno())
+
+
+def load_pickles(fname, truncate=False):
+    """ Return list of objects saved with append_pickle.
+
+    A truncated last record (writer died mid-write) is ignored. If truncate,
+    the file is also cut right after the last good record, so that records
+    appended afterwards are readable again.
+    """
+    out = []
+    end = 0
+    with open(fname, 'rb') as fin:
+        while True:
+            try:
+                out.append(pickle.load(fin))
+            except Exception:
+                # EOFError, or anything from unpickling a partial record
+                break
+            end = fin.tell()
+    if truncate and end < os.path.getsize(fname):
+        with open(fname, 'r+b') as fout:
+            fout.truncate(end)
+            fout.flush()
+            os.fsync(fout.fileno())
+
+    return out
@@ -1,24 +1,20 @@
-import tempfile
-import subprocess
-
 import numpy as np
 
-try:
-    from matplotlib import pyplot as plt
-except ImportError:
-    print('Cannot load matplotlib; continuing...')
+from .util import lazy_import
 
-import skimage.color
-import skimage.draw
+# heavy dependencies; only imported when needed
+plt = lazy_import('matplotlib.pyplot')
+skcolor = lazy_import('skimage.color')
+skdraw = lazy_import('skimage.draw')
 
 
 def draw_marker_img(im, pos, radius=5, color=(1., 0, 0)):
     """ Return image with marker on (x,y) position pos. """
     imout = im.copy()
     if imout.ndim == 2:
-        imout = skimage.color.gray2rgb(imout)
+        imout = skcolor.gray2rgb(imout)
 
-    rr, cc = skimage.draw.circle(int(pos[1]), int(pos[0]), radius, im.shape)
+    rr, cc = skdraw.circle(int(pos[1]), int(pos[0]), radius, im.shape)
     imout[rr, cc, :] = color
     return imout
 
@@ -27,8 +23,8 @@ def draw_vertical_line_img(im, j, color=(1., 0, 0)):
     """ Return image with vertical line at col j. """
     imout = im.copy()
     if imout.ndim == 2:
-        imout = skimage.color.gray2rgb(imout)
-    rr, cc = skimage.draw.line(0, int(j), im.shape[0]-1, int(j))
+        imout = skcolor.gray2rgb(imout)
+    rr, cc = skdraw.line(0, int(j), im.shape[0]-1, int(j))
     imout[rr, cc, :] = color
     return imout
 
@@ -37,8 +33,8 @@ def draw_horizontal_line_img(im, i, color=(1., 0, 0)):
     """ Return image with vertical line at row i. """
     imout = im.copy()
     if imout.ndim == 2:
-        imout = skimage.color.gray2rgb(imout)
-    rr, cc = skimage.draw.line(int(i), 0, int(i), im.shape[1]-1)
+        imout = skcolor.gray2rgb(imout)
+    rr, cc = skdraw.line(int(i), 0, int(i), im.shape[1]-1)
     imout[rr, cc, :] = color
     return imout
 
@@ -47,8 +43,8 @@ def draw_box_img(im, r, c, w, h, color=(1., 0, 0)):
     """ Return image box drawn. """
     imout = im.copy()
     if imout.ndim == 2:
-        imout = skimage.color.gray2rgb(imout)
-    rr, cc = skimage.draw.polygon_perimeter([r, r, r+h, r+h, r], [c, c+w, c+w, c, c])
+        imout = skcolor.gray2rgb(imout)
+    rr, cc = skdraw.polygon_perimeter([r, r, r+h, r+h, r], [c, c+w, c+w, c, c])
     imout[rr, cc, :] = color
     return imout
 
@@ -57,61 +53,208 @@ def draw_cross_img(im, pos, radius=5, color=(1., 0, 0)):
     """ Return image with cross on (x,y) position pos. """
     imout = im.copy()
     if imout.ndim == 2:
-        imout = skimage.color.gray2rgb(imout)
+        imout = skcolor.gray2rgb(imout)
 
     i, j, r = pos[1], pos[0], radius
-    rr, cc = skimage.draw.line(int(i), int(j-r/2), int(i), int(j+r/2))
+    rr, cc = skdraw.line(int(i), int(j-r/2), int(i), int(j+r/2))
     valid = (rr > 0) & (rr < im.shape[1]) & (cc > 0) & (cc < im.shape[1])
     imout[rr[valid], cc[valid], :] = color
-    rr, cc = skimage.draw.line(int(i-r/2), int(j), int(i+r/2), int(j))
+    rr, cc = skdraw.line(int(i-r/2), int(j), int(i+r/2), int(j))
     valid = (rr > 0) & (rr < im.shape[1]) & (cc > 0) & (cc < im.shape[1])
     imout[rr[valid], cc[valid], :] = color
 
     return imout
 
 
-def tile_imgs(imgs, gap=1, fill=np.nan):
+def _draw_target(im, inplace):
+    """ Return RGB image to draw on: im itself if inplace, else a copy. """
+    if inplace:
+        if im.ndim != 3:
+            raise ValueError('Cannot draw in place on gray image')
+        return im
+    if im.ndim == 2:
+        return skcolor.gray2rgb(im)
+    return im.copy()
+
+
+def _set_pixels(imout, rr, cc, idx, color):
+    """ Set imout[rr, cc] = color, skipping pixels outside of image.
+
+    color is either one color or one per annotation; idx is the annotation of each pixel.
+    """
+    valid = (rr >= 0) & (rr < imout.shape[0]) & (cc >= 0) & (cc < imout.shape[1])
+    color = np.asarray(color)
+    if color.ndim == 2:
+        color = color[idx[valid]]
+    imout[rr[valid], cc[valid], :] = color
+
+    return imout
+
+
+def _ragged_arange(lengths):
+    """ Concatenation of range(l) for l in lengths.
+
+    >>> _ragged_arange([2, 3])
+    array([0, 1, 0, 1, 2])
+    """
+    lengths = np.asarray(lengths, dtype=int)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.arange(lengths.sum()) - offsets
+
+
+def _lines_pixels(r0, c0, r1, c1):
+    """ Return rows, cols and line index of pixels on lines (r0, c0) -> (r1, c1). """
+    r0, c0, r1, c1 = [np.asarray(x).astype(int).ravel() for x in [r0, c0, r1, c1]]
+    dr, dc = r1 - r0, c1 - c0
+    n = np.maximum(abs(dr), abs(dc)) + 1
+    idx = np.repeat(np.arange(len(n)), n)
+    k, m = _ragged_arange(n), np.maximum(n - 1, 1)[idx]
+    # offsets k*d/m from the start, rounded half away from the start as
+    # skimage.draw.line does; exact in integers (np.round rounds half to even)
+    rr = r0[idx] + np.sign(dr[idx]) * ((2 * k * abs(dr[idx]) + m) // (2 * m))
+    cc = c0[idx] + np.sign(dc[idx]) * ((2 * k * abs(dc[idx]) + m) // (2 * m))
+
+    return rr, cc, idx
+
+
+def _offsets_pixels(pos, dr, dc):
+    """ Return rows, cols and annotation index of offsets (dr, dc) around (x, y) positions. """
+    pos = np.asarray(pos).reshape(-1, 2).astype(int)
+    rr = (pos[:, 1:2] + dr[np.newaxis]).ravel()
+    cc = (pos[:, 0:1] + dc[np.newaxis]).ravel()
+    idx = np.repeat(np.arange(len(pos)), len(dr))
+
+    return rr, cc, idx
+
+
+def draw_markers_img(im, pos, radius=5, color=(1., 0, 0), inplace=False):
+    """ Return image with markers on (x,y) positions pos (N x 2).
+
+    Batch version of draw_marker_img; color is one color or one per marker (N x 3).
+    """
+    dr, dc = np.mgrid[-radius:radius+1, -radius:radius+1]
+    disk = dr**2 + dc**2 < radius**2
+    imout = _draw_target(im, inplace)
+    return _set_pixels(imout, *_offsets_pixels(pos, dr[disk], dc[disk]), color)
+
+
+def draw_crosses_img(im, pos, radius=5, color=(1., 0, 0), inplace=False):
+    """ Return image with crosses on (x,y) positions pos (N x 2).
+
+    Batch version of draw_cross_img; color is one color or one per cross (N x 3).
+    """
+    j, i = np.asarray(pos, dtype=float).reshape(-1, 2).T
+    r = radius
+    # same truncations as draw_cross_img; 2 lines per cross, cross-major
+    lines = np.stack([np.stack([i, j-r/2, i, j+r/2], axis=1),
+                      np.stack([i-r/2, j, i+r/2, j], axis=1)], axis=1).reshape(-1, 4)
+    color = np.asarray(color)
+    if color.ndim == 2:
+        color = np.repeat(color, 2, axis=0)
+    return draw_lines_img(im, lines, color, inplace)
+
+
+def draw_lines_img(im, lines, color=(1., 0, 0), inplace=False):
+    """ Return image with lines (N x 4) drawn; each line is (r0, c0, r1, c1).
+
+    color is one color or one per line (N x 3).
+    """
+    lines = np.asarray(lines).reshape(-1, 4)
+    imout = _draw_target(im, inplace)
+    return _set_pixels(imout, *_lines_pixels(*lines.T), color)
+
+
+def draw_vertical_lines_img(im, j, color=(1., 0, 0), inplace=False):
+    """ Return image with vertical lines at cols j. """
+    j = np.asarray(j).ravel()
+    lines = np.stack([np.zeros_like(j), j, np.full_like(j, im.shape[0]-1), j], axis=1)
+    return draw_lines_img(im, lines, color, inplace)
+
+
+def draw_horizontal_lines_img(im, i, color=(1., 0, 0), inplace=False):
+    """ Return image with horizontal lines at rows i. """
+    i = np.asarray(i).ravel()
+    lines = np.stack([i, np.zeros_like(i), i, np.full_like(i, im.shape[1]-1)], axis=1)
+    return draw_lines_img(im, lines, color, inplace)
+
+
+def draw_boxes_img(im, boxes, color=(1., 0, 0), inplace=False):
+    """ Return image with boxes (N x 4) drawn; each box is (r, c, w, h) as in draw_box_img.
+
+    color is one color or one per box (N x 3).
+    """
+    r, c, w, h = np.asarray(boxes).reshape(-1, 4).T
+    # 4 sides per box, box-major
+    lines = np.stack([np.stack([r, c, r, c+w], axis=1),
+                      np.stack([r, c+w, r+h, c+w], axis=1),
+                      np.stack([r+h, c+w, r+h, c], axis=1),
+                      np.stack([r+h, c, r, c], axis=1)], axis=1).reshape(-1, 4)
+    color = np.asarray(color)
+    if color.ndim == 2:
+        color = np.repeat(color, 4, axis=0)
+    return draw_lines_img(im, lines, color, inplace)
+
+
+def _normalize_uint8(imgs, nimgdims):
+    """ Scale each image (last nimgdims dims of imgs) by 255/max to uint8. """
+    if imgs.dtype == np.uint8:
+        return imgs
+    axes = tuple(range(imgs.ndim - nimgdims, imgs.ndim))
+    imax = imgs.max(axis=axes, keepdims=True)
+    out = np.divide(255. * imgs, imax, out=np.zeros(imgs.shape), where=imax > 0)
+    return np.clip(out, 0, 255, out=out).astype('uint8')
+
+
+def tile_imgs(imgs, gap=1, fill=0, ncols=None, out=None):
     """ Create a single image by tiling nrow x ncol images.
 
+    Images that are not uint8 are scaled to uint8 by their maxima. The mosaic is
+    written with a single strided copy; pass the previous output as out to reuse
+    the canvas across frames.
+
     Args:
-        imgs (list of lists)
+        imgs (list of lists or array): (rows, cols, H, W[, C]); (N, H, W) is a single row
+        gap (int): pixels between images
+        fill (int): value of gaps (and padding images)
+        ncols (int): if given, imgs is (N, H, W[, C]), laid out in rows of ncols images
+        out (array): uint8 canvas of the output shape to write to
+
+    Returns:
+        uint8 array
     """
-    if isinstance(imgs, np.ndarray):
-        if imgs.ndim == 3:
-            imgs = imgs[np.newaxis]
-    elif not isinstance(imgs[0], (list, tuple)):
-        imgs = [imgs]
-
-    if imgs[0][0].dtype != 'uint8':
-        for row in range(len(imgs)):
-            for col in range(len(imgs[0])):
-                im = imgs[row][col]
-                imgs[row][col] = (255 * im / im.max()).astype('uint8')
-
-    nrows = len(imgs)
-    ncols = len(imgs[0])
-
-    try:
-        H, W = imgs[0][0].shape
-        figout = np.empty((nrows*H + (nrows-1)*gap,
-                           ncols*W + (ncols-1)*gap),
-                          dtype='uint8')
-    except ValueError:
-        H, W, C = imgs[0][0].shape
-        figout = np.empty((nrows*H + (nrows-1)*gap,
-                           ncols*W + (ncols-1)*gap,
-                           C),
-                          dtype='uint8')
-
-    figout.fill(fill)
-
-    for i in range(nrows):
-        for j in range(ncols):
-            top = i*H + i*gap
-            left = j*W + j*gap
-            figout[top:top+H, left:left+W, ...] = imgs[i][j]
-
-    return figout
+    if ncols is not None:
+        imgs = _normalize_uint8(np.asarray(imgs), np.ndim(imgs) - 1)
+        nrows = -(-len(imgs) // ncols)
+        npad = nrows*ncols - len(imgs)
+        if npad > 0:
+            imgs = np.concatenate([imgs, np.full((npad,) + imgs.shape[1:], fill, 'uint8')])
+        imgs = imgs.reshape((nrows, ncols) + imgs.shape[1:])
+    else:
+        if isinstance(imgs, np.ndarray):
+            if imgs.ndim == 3:
+                imgs = imgs[np.newaxis]
+        elif not isinstance(imgs[0], (list, tuple)):
+            imgs = [imgs]
+        imgs = np.asarray(imgs)
+        imgs = _normalize_uint8(imgs, imgs.ndim - 2)
+
+    nrows, ncols, H, W = imgs.shape[:4]
+    shape = (nrows*H + (nrows-1)*gap, ncols*W + (ncols-1)*gap) + imgs.shape[4:]
+    if out is None:
+        out = np.empty(shape, dtype='uint8')
+    elif out.shape != shape or out.dtype != np.uint8:
+        raise ValueError('out must be uint8 of shape {}'.format(shape))
+    if gap > 0:
+        out.fill(fill)
+
+    # view of out as (nrows, H, ncols, W[, C]), skipping the gaps
+    s = out.strides
+    tiles = np.lib.stride_tricks.as_strided(out,
+                                            (nrows, H, ncols, W) + imgs.shape[4:],
+                                            (s[0]*(H+gap), s[0], s[1]*(W+gap), s[1]) + s[2:])
+    tiles[...] = imgs.transpose((0, 2, 1, 3) + tuple(range(4, imgs.ndim)))
+
+    return out
 
 
 def savefig_tight(fname):
@@ -123,12 +266,76 @@ def savefig_tight(fname):
     plt.savefig(fname, bbox_inches='tight', pad_inches=0.0)
 
 
-def fig_to_array(fig):
-    """ From: http://stackoverflow.com/questions/7821518/matplotlib-save-plot-to-numpy-array. """
-    data = np.fromstring(fig.canvas.tostring_rgb(), dtype=np.uint8, sep='')
-    data = data.reshape(fig.canvas.get_width_height()[::-1] + (3,))
+def fig_to_array(fig, draw=True, rgba=False, copy=True):
+    """ Return figure pixels as (H, W, 3) (or (H, W, 4) if rgba) uint8 array.
+
+    Args:
+        fig: figure with Agg canvas
+        draw (bool): draw the canvas first
+        rgba (bool): keep alpha channel
+        copy (bool): if False, return a view of the Agg canvas buffer (no copy),
+                     which changes when the figure is redrawn
+    """
+    if draw:
+        fig.canvas.draw()
+    data = np.asarray(fig.canvas.buffer_rgba())
+    if not rgba:
+        data = data[..., :3]
+
+    return data.copy() if copy else data
+
 
-    return data
+class OffscreenRenderer:
+    """ Render line plots to arrays, reusing one offscreen figure.
+
+    Axes, ticks and labels are drawn once and cached; each frame only restores
+    the cached background and redraws the lines with new data (blitting).
+    Axes limits are fixed; call redraw after changing them.
+
+    Examples:
+    >>> r = OffscreenRenderer(nlines=2, xlim=(0, 10), ylim=(-1, 1), figsize=(2, 1), dpi=50)
+    >>> t = np.linspace(0, 10)
+    >>> r.render((t, np.sin(t)), (t, np.cos(t))).shape
+    (50, 100, 3)
+    """
+    def __init__(self, nlines=1, xlim=(0, 1), ylim=(0, 1), figsize=(6.4, 4.8), dpi=100,
+                 title='', legend=None, **plot_kwargs):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(111)
+        self.ax.set_title(title)
+        self.lines = [self.ax.plot([], [], animated=True, **plot_kwargs)[0]
+                      for _ in range(nlines)]
+        if legend is not None:
+            for line, label in zip(self.lines, legend):
+                line.set_label(label)
+            self.ax.legend(loc='upper right')
+        self.ax.set_xlim(xlim)
+        self.ax.set_ylim(ylim)
+        self.redraw()
+
+    def redraw(self):
+        """ Draw full figure (without lines) and cache it as background. """
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def render(self, *data, copy=False):
+        """ Return frame with lines set to data.
+
+        Args:
+            data: one (x, y) pair per line
+            copy (bool): copy frame; by default, frames are views of the same buffer
+        """
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        for line, (x, y) in zip(self.lines, data):
+            line.set_data(x, y)
+            self.ax.draw_artist(line)
+
+        return fig_to_array(self.fig, draw=False, copy=copy)
 
 
 def subplot_ts_lines(*timeseries, title='', legend=''):
@@ -147,17 +354,101 @@ def subplot_ts_lines(*timeseries, title='', legend=''):
     plt.legend(legend)
 
 
+def aggregate_blocks(matrix, block):
+    """ Sum matrix over blocks of block x block entries (zero padding the border).
+
+    >>> aggregate_blocks(np.ones((5, 5)), 2)
+    array([[4., 4., 2.],
+           [4., 4., 2.],
+           [2., 2., 1.]])
+    """
+    n = -(-matrix.shape[0] // block)
+    padded = np.zeros((n*block, n*block), dtype=matrix.dtype)
+    padded[:matrix.shape[0], :matrix.shape[1]] = matrix
+    return padded.reshape(n, block, n, block).sum(axis=(1, 3))
+
+
 def confusion_matrix(matrix, labels=[],
                      title='cols are predictions; rows are real labels',
-                     saveto=''):
-    import seaborn as sns
-    fig = plt.figure()
-    f = sns.heatmap(matrix, annot=True, fmt='.2f')
-    f.set_xticklabels(labels, rotation='vertical')
-    f.set_yticklabels(labels[::-1], rotation='horizontal')
-    f.set_title(title)
+                     saveto='',
+                     order=None,
+                     block=None,
+                     annot_max=30,
+                     labels_max=100,
+                     interactive=True,
+                     return_array=False,
+                     cmap=None):
+    """ Plot confusion matrix as a single raster image.
+
+    Scales to large label sets: values are only annotated for small matrices,
+    and classes can be reordered and aggregated in blocks.
+
+    Args:
+        matrix (n x n array): rows are real labels, cols are predictions
+        labels (list): class names
+        title (str):
+        saveto (str): save figure to this file
+        order (list): permutation of classes (e.g. to group confused classes)
+        block (int): sum blocks of block x block classes; blocks are labeled
+                     'first-last' by the labels (or ids) of their classes
+        annot_max (int): annotate values when there are at most this many classes
+        labels_max (int): show labels when there are at most this many classes
+        interactive (bool): create figure with pyplot; else use an offscreen figure
+        return_array (bool): return rendered (H, W, 3) array instead of figure
+                             (a pyplot figure is closed after rendering)
+        cmap: matplotlib colormap
+
+    Returns:
+        figure or array
+    """
+    matrix = np.asarray(matrix)
+    labels = list(labels)
+    ids = list(range(matrix.shape[0]))
+    if order is not None:
+        matrix = matrix[np.ix_(order, order)]
+        labels = [labels[i] for i in order] if labels else []
+        ids = list(order)
+    if block is not None and block > 1:
+        n = matrix.shape[0]
+        matrix = aggregate_blocks(matrix, block)
+        # blocks are labeled by their first and last (permuted) classes
+        names = labels or ids
+        labels = ['{}-{}'.format(names[i], names[min(i+block, n)-1]) for i in range(0, n, block)]
+    n = matrix.shape[0]
+
+    if interactive:
+        fig = plt.figure()
+    else:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure()
+        FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    # antialiased: large matrices are downsampled without dropping isolated entries
+    img = ax.imshow(matrix, cmap=cmap, interpolation='antialiased')
+    fig.colorbar(img, ax=ax)
+    ax.set_title(title)
+
+    if labels and n <= labels_max:
+        ax.set_xticks(range(n))
+        ax.set_yticks(range(n))
+        ax.set_xticklabels(labels, rotation='vertical')
+        ax.set_yticklabels(labels, rotation='horizontal')
+
+    if n <= annot_max:
+        thresh = (matrix.max() + matrix.min()) / 2
+        for (i, j), v in np.ndenumerate(matrix):
+            ax.text(j, i, '{:.2f}'.format(v), ha='center', va='center', fontsize='small',
+                    color='black' if v > thresh else 'white')
+
     if saveto:
-        plt.savefig(saveto, bbox_inches='tight', pad_inches=0.0)
+        fig.savefig(saveto, bbox_inches='tight', pad_inches=0.0)
+
+    if return_array:
+        out = fig_to_array(fig)
+        if interactive:
+            plt.close(fig)
+        return out
 
     return fig
 
@@ -169,12 +460,102 @@ def plot3d(fun='plot', *args, **kwargs):
     getattr(ax, fun)(*args, **kwargs)
 
 
-def save_gif(ims, outname, delay=50):
-  """Make a gif from set of images."""
-  with tempfile.TemporaryDirectory() as d:
-    imfiles = [f'{d}/{i:03}.png' for i, _ in enumerate(ims)]
-    for imfile, im in zip(imfiles, ims):
-      plt.imsave(imfile, im)
-    cmd = f'convert {" ".join(imfiles)} -set delay {delay} -loop 0 {outname}'
-    subprocess.call(cmd.split(' '))
+class GifWriter:
+    """ Write GIF frame by frame, encoding in-process with Pillow.
 
+    Frames are encoded and written as they come, so memory does not grow with
+    the number of frames.
+
+    Examples:
+    >>> import os, tempfile
+    >>> fname = os.path.join(tempfile.mkdtemp(), 'out.gif')
+    >>> with GifWriter(fname, fps=20) as writer:
+    ...     writer.write_all(np.random.rand(10, 32, 3) for _ in range(3))
+    >>> from PIL import Image
+    >>> Image.open(fname).n_frames
+    3
+    """
+    def __init__(self, fname, fps=10., loop=0, palette='adaptive', colors=256):
+        """
+        Args:
+            fname (str): output file
+            fps (float): frame rate
+            loop (int): number of loops; 0 is forever
+            palette (str or array): 'adaptive' - each frame gets its own palette
+                                    'first' - palette of first frame is reused for all
+                                    (n, 3) uint8 array - fixed palette
+            colors (int): max number of colors of adaptive palettes
+        """
+        from PIL import Image
+
+        if isinstance(palette, str):
+            if palette not in ['adaptive', 'first']:
+                raise ValueError('Unknown palette: {}'.format(palette))
+            self.palette = None
+        else:
+            self.palette = Image.new('P', (1, 1))
+            self.palette.putpalette(np.asarray(palette, dtype='uint8').ravel().tolist())
+        self.mode = palette if isinstance(palette, str) else 'fixed'
+        self.duration = 1000. / fps
+        self.loop = loop
+        self.colors = colors
+        self.size = None
+        self.fp = open(fname, 'wb')
+
+    def _quantize(self, frame):
+        """ Convert frame to palette image. """
+        from PIL import Image
+
+        frame = np.asarray(frame)
+        if frame.dtype != np.uint8:
+            frame = (255 * np.clip(frame, 0, 1)).astype('uint8')
+        if frame.ndim == 2:
+            frame = np.stack([frame]*3, axis=-1)
+        im = Image.fromarray(np.ascontiguousarray(frame[..., :3]))
+        if self.palette is not None:
+            return im.quantize(palette=self.palette)
+
+        return im.quantize(self.colors)
+
+    def write(self, frame):
+        """ Encode and write frame ((H, W) or (H, W, 3|4) array; floats in [0, 1]). """
+        from PIL import GifImagePlugin
+
+        im = self._quantize(frame)
+        params = {'duration': self.duration}
+        if self.size is None:
+            # first frame palette goes on the global color table
+            self.size = im.size
+            header, _ = GifImagePlugin.getheader(im, info={'loop': self.loop,
+                                                           'duration': self.duration})
+            self.fp.writelines(header)
+            if self.mode == 'first':
+                self.palette = im
+        elif im.size != self.size:
+            raise ValueError('Frame size {} differs from {}'.format(im.size, self.size))
+        elif self.mode == 'adaptive':
+            params['include_color_table'] = True
+
+        self.fp.writelines(GifImagePlugin.getdata(im, **params))
+
+    def write_all(self, frames):
+        """ Write all frames from list or generator. """
+        for f in frames:
+            self.write(f)
+
+    def close(self):
+        if not self.fp.closed:
+            self.fp.write(b';')  # trailer
+            self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def save_gif(ims, outname, delay=50):
+    """ Make a gif from set of images (list or generator); delay is in 1/100 s. """
+    with GifWriter(outname, fps=100/delay) as writer:
+        writer.write_all(ims)
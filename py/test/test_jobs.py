@@ -0,0 +1,108 @@
+import time
+
+from ce_common import jobs
+
+
+def test_run_jobs():
+    joblist = [{'id': i, 'cmd': ['sh', '-c', 'echo out{}; exit {}'.format(i, i % 2)]}
+               for i in range(6)]
+    out = jobs.run_jobs(joblist)
+
+    assert sorted(out.keys()) == list(range(6))
+    for i in range(6):
+        assert out[i].returncode == i % 2
+        assert out[i].lines == ['out{}\n'.format(i)]
+        assert not out[i].timed_out
+
+
+def test_run_jobs_logfile(tmpdir):
+    logname = str(tmpdir.join('a.log'))
+    out = jobs.run_jobs([{'id': 'a', 'cmd': ['sh', '-c', 'echo 1; echo 2 >&2'],
+                          'logname': logname}])
+    assert out['a'].lines == ['1\n', '2\n']
+    with open(logname) as fin:
+        assert fin.read() == '1\n2\n'
+
+
+def test_run_jobs_concurrent():
+    # 100 jobs sleeping 0.5s each must run concurrently
+    joblist = [{'id': i, 'cmd': ['sleep', '0.5']} for i in range(100)]
+    t0 = time.time()
+    out = jobs.run_jobs(joblist)
+    assert time.time() - t0 < 5
+    assert all(o.returncode == 0 for o in out.values())
+
+
+def test_run_jobs_slots():
+    running, max_running = set(), [0]
+    used_slots = []
+
+    def on_start(job, slot):
+        running.add(job['id'])
+        used_slots.append(slot)
+        max_running[0] = max(max_running[0], len(running))
+
+    def on_done(job, result):
+        running.remove(job['id'])
+
+    def prepare(job, slot):
+        return job['cmd'] + ['slot{}'.format(slot)], None
+
+    joblist = [{'id': i, 'cmd': ['sh', '-c', 'sleep 0.1; echo $0']} for i in range(8)]
+    out = jobs.run_jobs(joblist, slots=[0, 1], prepare=prepare,
+                        on_start=on_start, on_done=on_done)
+
+    assert max_running[0] == 2
+    assert set(used_slots) == {0, 1}
+    assert not running
+    assert all(o.lines[0].strip() in ['slot0', 'slot1'] for o in out.values())
+
+
+def test_run_jobs_timeout():
+    joblist = [{'id': 'fast', 'cmd': ['true']},
+               {'id': 'slow', 'cmd': ['sleep', '30']},
+               # ignores SIGTERM; must be killed
+               {'id': 'stubborn', 'cmd': ['sh', '-c', 'trap "" TERM; sleep 30']},
+               {'id': 'override', 'cmd': ['sleep', '0.5'], 'timeout': 10}]
+    t0 = time.time()
+    out = jobs.run_jobs(joblist, timeout=0.3, term_timeout=0.3)
+    assert time.time() - t0 < 5
+
+    assert not out['fast'].timed_out and out['fast'].returncode == 0
+    assert out['slow'].timed_out and out['slow'].returncode == -15
+    assert out['stubborn'].timed_out and out['stubborn'].returncode == -9
+    assert not out['override'].timed_out and out['override'].returncode == 0
+
+
+def test_run_jobs_timeout_output():
+    # captured output up to the timeout is kept
+    out = jobs.run_jobs([{'id': 'a', 'cmd': ['sh', '-c', 'echo started; sleep 5']}],
+                        timeout=0.5)
+    assert out['a'].timed_out
+    assert out['a'].lines == ['started\n']
+
+
+def test_run_jobs_async_hooks():
+    done = []
+
+    async def on_done(job, result):
+        done.append((job['id'], result.returncode))
+
+    jobs.run_jobs([{'id': i, 'cmd': ['true']} for i in range(3)], on_done=on_done)
+    assert sorted(done) == [(0, 0), (1, 0), (2, 0)]
+
+
+def test_run_jobs_errors():
+    # a bad job or hook fails alone; other jobs keep running
+    def on_done(job, result):
+        if job['id'] == 'c':
+            raise RuntimeError('hook')
+
+    out = jobs.run_jobs([{'id': 'a', 'cmd': ['sleep', '0.3']},
+                         {'id': 'b', 'cmd': ['/nonexistent']},
+                         {'id': 'c', 'cmd': ['true']}], on_done=on_done)
+    assert out['a'].returncode == 0 and out['a'].runtime > 0.25
+    assert out['b'].returncode == 127
+    assert 'FileNotFoundError' in out['b'].lines[0]
+    assert out['c'].returncode == 0
+    assert "RuntimeError('hook')" in out['c'].lines[-1]
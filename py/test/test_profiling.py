@@ -0,0 +1,110 @@
+import json
+import threading
+import tracemalloc
+
+import numpy as np
+
+from ce_common import math, util, jobs, profiling
+
+
+def test_profile():
+    rotvol = math.rotvol
+    with profiling.profile(math, util) as stats:
+        assert math.rotvol is not rotvol
+        for _ in range(3):
+            math.rotvol(np.zeros((8, 8, 8)), math.rotx(0.1))
+        util.rescale(np.arange(5))
+
+    # functions are restored and nothing else is recorded
+    assert math.rotvol is rotvol
+    assert not profiling.is_enabled()
+    math.rotx(0.1)
+
+    assert stats['ce_common.math.rotvol'].calls == 3
+    assert stats['ce_common.math.rotx'].calls == 3
+    assert stats['ce_common.util.rescale'].calls == 1
+    assert sum(stats['ce_common.math.rotvol'].hist.values()) == 3
+    assert stats['ce_common.math.rotvol'].wall > 0
+
+    assert 'ce_common.math.rotvol' in profiling.summary()
+    out = json.loads(profiling.to_json())
+    assert out['ce_common.math.rotx']['calls'] == 3
+
+
+def test_profile_memory():
+    with profiling.profile(math, memory=True) as stats:
+        math.rotvol(np.zeros((32, 32, 32)), math.rotx(0.1))
+    # rotvol allocates several arrays of 32**3 elements
+    assert stats['ce_common.math.rotvol'].bytes > 32**3 * 8
+
+
+def test_timed():
+    @profiling.timed
+    def f(x):
+        return x + 1
+
+    profiling.reset()
+    assert f(1) == 2
+    assert not profiling.stats()
+
+    profiling.enable()
+    try:
+        f(1)
+        f(2)
+    finally:
+        profiling.disable()
+    name = [k for k in profiling.stats() if k.endswith('test_timed.<locals>.f')][0]
+    assert profiling.stats()[name].calls == 2
+
+
+def test_jobs_metrics():
+    out = jobs.run_jobs([{'id': i, 'cmd': ['sleep', '0.2']} for i in range(3)], slots=[0])
+    waits = sorted(o.queue_wait for o in out.values())
+    assert waits[0] < 0.1
+    assert waits[2] > 0.35
+    assert all(0.15 < o.runtime < 1 for o in out.values())
+
+
+def test_cpu_hist():
+    profiling.reset()
+    profiling.enable()
+    try:
+        profiling.record('a', wall=1e-3, cpu=5e-6)
+        profiling.record('a', wall=2e-3, cpu=1e-3)
+    finally:
+        profiling.disable()
+    out = json.loads(profiling.to_json())['a']
+    assert out['wall_hist_us'] == {'<1024': 1, '<2048': 1}
+    assert out['cpu_hist_us'] == {'<8': 1, '<1024': 1}
+
+
+def test_record_threads():
+    profiling.reset()
+    profiling.enable()
+    try:
+        threads = [threading.Thread(target=lambda: [profiling.record('t', 1e-6)
+                                                    for _ in range(1000)])
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        profiling.disable()
+    assert profiling.stats()['t'].calls == 8000
+
+
+def test_tracemalloc_ownership():
+    # tracemalloc started elsewhere is left running
+    tracemalloc.start()
+    try:
+        profiling.enable(memory=True)
+        profiling.disable()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+    profiling.enable(memory=True)
+    assert tracemalloc.is_tracing()
+    profiling.disable()
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,331 @@
+import os
+
+import numpy as np
+import pytest
+
+from ce_common import tfutil
+
+
+JOB_SCRIPT = '''
+import os, sys
+jobid, logfile, okfile = sys.argv[1:]
+with open(logfile, 'a') as fout:
+    fout.write(jobid + '\\n')
+print('loss', jobid)
+# job 'b' fails until okfile exists
+sys.exit(1 if jobid == 'b' and not os.path.isfile(okfile) else 0)
+'''
+
+
+@pytest.mark.parametrize("engine", ['threads', 'asyncio'])
+def test_dispatch_journal_resume(tmpdir, engine):
+    script = tmpdir.join('job.py')
+    script.write(JOB_SCRIPT)
+    runs, okfile = str(tmpdir.join('runs.txt')), str(tmpdir.join('ok'))
+    params = [{'id': i, 'cmd': '{} {} {} {}'.format(script, i, runs, okfile),
+               'logdir': str(tmpdir.join('logs'))}
+              for i in ['a', 'b', 'c']]
+    outfile = str(tmpdir.join('res', 'out.pkl'))
+
+    out = tfutil.dispatch(params, outfile, gpus=[0, 1], engine=engine)
+    assert {k: v.returncode for k, v in out.items()} == {'a': 0, 'b': 1, 'c': 0}
+    assert out['a'].lines == ['loss a\n']
+
+    # one journal record per job
+    journal = tfutil.util.load_pickles(tfutil.journal_name(outfile))
+    assert sorted(r['params']['id'] for r in journal) == ['a', 'b', 'c']
+
+    # interrupted run: no final pickle, results recovered from journal
+    os.remove(outfile)
+    res = tfutil.load_results(outfile)
+    assert sorted(res['out']) == ['a', 'b', 'c']
+    assert res['out']['b'].returncode == 1
+    assert sorted(p['id'] for p in res['params']) == ['a', 'b', 'c']
+
+    # resume only reruns the failed job
+    open(okfile, 'w').close()
+    out = tfutil.dispatch(params, outfile, gpus=[0, 1], engine=engine, resume=True)
+    assert {k: v.returncode for k, v in out.items()} == {'a': 0, 'b': 0, 'c': 0}
+    with open(runs) as fin:
+        assert sorted(fin.read().split()) == ['a', 'b', 'b', 'c']
+    res = tfutil.load_results(outfile)
+    assert res['out']['b'].returncode == 0
+
+    # without resume, everything runs again
+    tfutil.dispatch(params, outfile, gpus=[0, 1], engine=engine)
+    with open(runs) as fin:
+        assert len(fin.read().split()) == 7
+
+
+def test_dispatch_asyncio_timeout(tmpdir):
+    script = tmpdir.join('slow.py')
+    script.write('import time\nprint("started", flush=True)\ntime.sleep(30)\n')
+    params = [{'id': 'slow', 'cmd': str(script), 'logdir': str(tmpdir)},
+              {'id': 'short', 'cmd': str(script), 'logdir': str(tmpdir), 'timeout': 0.5}]
+    outfile = str(tmpdir.join('out.pkl'))
+    out = tfutil.dispatch(params, outfile, gpus=[0, 1], engine='asyncio', timeout=1)
+    assert all(o.timed_out for o in out.values())
+    assert out['slow'].runtime > out['short'].runtime
+    assert out['slow'].lines == ['started\n']
+
+
+def _tf():
+    """ Import tensorflow or skip; the tensorflow utilities use the 1.x API. """
+    tf = pytest.importorskip('tensorflow')
+    if not hasattr(tf, 'Session'):
+        pytest.skip('requires tensorflow 1.x')
+    return tf
+
+
+def _small_model(tf):
+    return tf.keras.Sequential([tf.keras.layers.Conv2D(4, 3, input_shape=(8, 8, 2)),
+                                tf.keras.layers.Flatten(),
+                                tf.keras.layers.Dense(10)])
+
+
+def test_profile_model_keras():
+    tf = _tf()
+    with tf.Graph().as_default():
+        model = _small_model(tf)
+        prof = tfutil.profile_model(model, input_shape=(2, 8, 8, 2))
+
+    # conv: 3*3*2*4 kernel + 4 bias; dense: 6*6*4*10 kernel + 10 bias
+    assert [l.params for l in prof.layers] == [76, 0, 1450]
+    assert prof.params == 1526
+    assert prof.bytes == 4 * 1526
+    assert prof.bytes_by_dtype == {'float32': 4 * 1526}
+
+    # 2*k*n_out multiply-adds (+ bias) per example; flatten counts one op per output
+    n = 2
+    assert [l.flops for l in prof.layers] == [n * (2 * 72 * 36 + 144), n * 144, n * (2 * 1440 + 10)]
+    assert prof.flops == sum(l.flops for l in prof.layers)
+
+    # activations, float32: input 8*8*2, conv/flatten 6*6*4, dense 10
+    assert [l.activation_bytes for l in prof.layers] == [n * 576, n * 576, n * 40]
+    assert prof.peak_activation_bytes == n * (576 + 576)
+
+
+def test_profile_model_batch_none():
+    tf = _tf()
+    with tf.Graph().as_default():
+        model = _small_model(tf)
+        prof = tfutil.profile_model(model, input_shape=(None, 8, 8, 2))
+        assert prof.peak_activation_bytes == 576 + 576
+        assert prof.flops == tfutil.profile_model(model, input_shape=(1, 8, 8, 2)).flops
+
+        # spatial dimensions must be defined
+        model = tf.keras.Sequential([tf.keras.layers.Conv2D(4, 3, input_shape=(None, None, 2)),
+                                     tf.keras.layers.GlobalAveragePooling2D()])
+        with pytest.raises(ValueError):
+            tfutil.profile_model(model, input_shape=(None, None, None, 2))
+
+
+def test_profile_model_functional():
+    tf = _tf()
+    layers = tf.keras.layers
+    with tf.Graph().as_default():
+        inp = layers.Input((8, 8, 2))
+        a = layers.Conv2D(4, 3, padding='same', name='a')(inp)
+        b = layers.Conv2D(4, 1, name='b')(inp)
+        c = layers.Add(name='add')([a, b])
+        d = layers.Concatenate(name='concat')([c, inp])
+        e = layers.DepthwiseConv2D(3, padding='same', name='dw')(d)
+        f = layers.Conv2DTranspose(2, 2, strides=2, name='tconv')(e)
+        g = layers.SeparableConv2D(3, 3, padding='same', depth_multiplier=2, name='sep')(inp)
+        model = tf.keras.Model(inp, [f, g])
+        prof = tfutil.profile_model(model, input_shape=(None, 8, 8, 2))
+
+        rnn = tf.keras.Sequential([layers.LSTM(4, input_shape=(5, 3), name='lstm'),
+                                   layers.Dense(2, name='dense')])
+        prof_rnn = tfutil.profile_model(rnn, input_shape=(None, 5, 3))
+
+    flops = {l.name: l.flops for l in prof.layers}
+    assert flops == {'a': 2 * 72 * 64 + 256,
+                     'b': 2 * 8 * 64 + 256,
+                     'add': 256,
+                     'concat': 384,
+                     # one 3x3 window per output, plus bias
+                     'dw': 2 * 9 * 384 + 384,
+                     # kernel applied at each of the 8x8 input positions
+                     'tconv': 2 * 2 * 2 * 2 * 6 * 64 + 512,
+                     # depthwise to 2*2 channels, then pointwise to 3
+                     'sep': 2 * 9 * 64 * 4 + 2 * 4 * 3 * 64 + 192}
+    assert prof.flops == sum(flops.values())
+    assert prof.flops_unsupported == []
+
+    # built shapes, not a chain: add reads a and b, concat reads add and the input
+    act = {l.name: l.activation_bytes for l in prof.layers}
+    assert act == {'a': 1024, 'b': 1024, 'add': 1024, 'concat': 1536, 'dw': 1536,
+                   'tconv': 2048, 'sep': 768}
+    assert prof.peak_activation_bytes == 1536 + 2048
+
+    assert prof_rnn.flops_unsupported == ['lstm']
+    assert prof_rnn.flops == 2 * 4 * 2 + 2
+
+
+def test_complex_helpers():
+    tf = _tf()
+    x0 = (np.random.randn(3, 5) + 1j*np.random.randn(3, 5)).astype('complex64')
+    r0 = np.random.randn(3, 5).astype('float32')
+    with tf.Graph().as_default():
+        x, r = tf.constant(x0), tf.constant(r0)
+        ops = {'abs2': tfutil.abs2(x),
+               'norm2': tfutil.norm2(x, axis=1),
+               'scale': tfutil.complex_scale(x, tf.constant(2., tf.float64)),
+               'normalize': tfutil.l2_normalize(x, axis=1),
+               'normalize_real': tfutil.l2_normalize(r, axis=1)}
+        assert ops['abs2'].dtype == tf.float32
+        assert ops['norm2'].dtype == tf.float32
+        assert ops['scale'].dtype == tf.complex64
+        assert ops['normalize'].dtype == tf.complex64
+        assert ops['normalize_real'].dtype == tf.float32
+
+        # safe_cast takes the precision of the wider real component
+        for a, b, expected in [(tf.complex64, tf.float64, tf.complex128),
+                               (tf.complex64, tf.float32, tf.complex64),
+                               (tf.float32, tf.complex128, tf.complex128),
+                               (tf.float16, tf.float32, tf.float32)]:
+            xa, xb = tfutil.safe_cast(tf.zeros(2, a), tf.zeros(2, b))
+            assert xa.dtype == xb.dtype == expected
+        with tf.Session() as sess:
+            out = sess.run(ops)
+
+    assert np.allclose(out['abs2'], np.abs(x0)**2, rtol=1e-5)
+    assert np.allclose(out['norm2'], np.linalg.norm(x0, axis=1)**2, rtol=1e-5)
+    assert np.allclose(out['scale'], 2 * x0)
+    assert np.allclose(out['normalize'], x0 / np.linalg.norm(x0, axis=1, keepdims=True),
+                       rtol=1e-5)
+    assert np.allclose(out['normalize_real'], r0 / np.linalg.norm(r0, axis=1, keepdims=True),
+                       rtol=1e-5)
+
+
+@pytest.mark.parametrize("dtype", ['float32', 'complex64'])
+def test_check_finite(dtype):
+    tf = _tf()
+    nan, inf = np.nan, np.inf
+    bad = [np.array([1, nan], dtype=dtype), np.array([1, inf], dtype=dtype)]
+    if dtype == 'complex64':
+        bad += [np.array([1, 1j*nan], dtype=dtype), np.array([1, -1j*inf], dtype=dtype)]
+    ok = np.array([1, 2], dtype=dtype)
+
+    try:
+        with tf.Graph().as_default() as graph:
+            x = tf.placeholder(dtype, [2])
+            tfutil.set_numerics_check('off')
+            n_ops = len(graph.get_operations())
+            assert tfutil.check_finite(x, 'off') is x
+            assert len(graph.get_operations()) == n_ops
+
+            tfutil.set_numerics_check('always')
+            y = tfutil.check_finite(x, 'always')
+            with tf.Session() as sess:
+                assert np.allclose(sess.run(y, {x: ok}), ok)
+                for b in bad:
+                    with pytest.raises(tf.errors.InvalidArgumentError):
+                        sess.run(y, {x: b})
+
+            # static shapes and no feeds: graph optimizations must not drop the check
+            v = tf.Variable(bad[0])
+            y = tfutil.check_finite(v * 2, 'variable')
+            with tf.Session() as sess:
+                sess.run(v.initializer)
+                with pytest.raises(tf.errors.InvalidArgumentError):
+                    sess.run(y)
+    finally:
+        tfutil.set_numerics_check()
+
+
+@pytest.mark.parametrize("dtype", ['float32', 'complex64'])
+def test_check_finite_sampled(dtype):
+    tf = _tf()
+    try:
+        with tf.Graph().as_default():
+            step = tf.train.create_global_step()
+            x = tf.placeholder(dtype, [2])
+            tfutil.set_numerics_check('sampled', every=3)
+            y = tfutil.check_finite(x, 'sampled')
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                for i in range(7):
+                    sess.run(step.assign(i))
+                    if i % 3 == 0:
+                        with pytest.raises(tf.errors.InvalidArgumentError):
+                            sess.run(y, {x: [1, np.nan]})
+                    else:
+                        sess.run(y, {x: [1, np.nan]})
+    finally:
+        tfutil.set_numerics_check()
+
+
+def _run_dataset(tf, ds):
+    batches = []
+    with tf.Session() as sess:
+        next_batch = ds.make_one_shot_iterator().get_next()
+        try:
+            while True:
+                batches.append(sess.run(next_batch))
+        except tf.errors.OutOfRangeError:
+            pass
+    return batches
+
+
+@pytest.mark.parametrize("memmap", [False, True])
+def test_numpy_dataset(tmpdir, memmap):
+    tf = _tf()
+    n = 50
+    x = np.arange(n * 3, dtype='float32').reshape(n, 3)
+    y = np.arange(n)
+    if memmap:
+        np.save(str(tmpdir.join('x.npy')), x)
+        x = np.load(str(tmpdir.join('x.npy')), mmap_mode='r')
+
+    with tf.Graph().as_default():
+        # one epoch yields every row once, with x and y rows matching
+        batches = _run_dataset(tf, tfutil.numpy_dataset([x, y], 7, block_size=8))
+        assert [len(b) for _, b in batches] == [7] * 7 + [1]
+        ys = np.concatenate([b for _, b in batches])
+        assert sorted(ys) == list(range(n))
+        assert np.array_equal(np.concatenate([b for b, _ in batches]), np.asarray(x)[ys])
+
+        ds = tfutil.numpy_dataset(x, 7, shuffle=False, block_size=8, drop_remainder=True)
+        assert ds.output_shapes.as_list() == [7, 3]
+        batches = _run_dataset(tf, ds)
+        assert len(batches) == 7
+        assert np.array_equal(np.concatenate(batches), np.asarray(x)[:49])
+
+        # py_map keeps static shapes
+        ds = tfutil.numpy_dataset([x, y], 7, block_size=8,
+                                  map_fn=tfutil.py_map(lambda a, b: (2 * a, b)))
+        assert [s.as_list() for s in ds.output_shapes] == [[None, 3], [None]]
+        batches = _run_dataset(tf, ds)
+        ys = np.concatenate([b for _, b in batches])
+        assert sorted(ys) == list(range(n))
+        assert np.array_equal(np.concatenate([b for b, _ in batches]), 2 * np.asarray(x)[ys])
+
+
+@pytest.mark.parametrize("engine", ['threads', 'asyncio'])
+def test_dispatch_resume_after_crash(tmpdir, engine):
+    script = tmpdir.join('job.py')
+    script.write(JOB_SCRIPT)
+    runs, okfile = str(tmpdir.join('runs.txt')), str(tmpdir.join('ok'))
+    params = [{'id': i, 'cmd': '{} {} {} {}'.format(script, i, runs, okfile),
+               'logdir': str(tmpdir.join('logs'))}
+              for i in ['a', 'c']]
+    outfile = str(tmpdir.join('out.pkl'))
+    tfutil.dispatch(params, outfile, gpus=[0], engine=engine)
+
+    # dispatcher died while writing the last record
+    os.remove(outfile)
+    journal = tfutil.journal_name(outfile)
+    with open(journal, 'rb') as fin:
+        data = fin.read()
+    with open(journal, 'wb') as fout:
+        fout.write(data[:-20])
+    assert len(tfutil.load_results(outfile)['out']) == 1
+
+    tfutil.dispatch(params, outfile, gpus=[0], engine=engine, resume=True)
+    os.remove(outfile)
+    res = tfutil.load_results(outfile)
+    assert {k: v.returncode for k, v in res['out'].items()} == {'a': 0, 'c': 0}
+    with open(runs) as fin:
+        assert len(fin.read().split()) == 3
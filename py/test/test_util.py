@@ -1,3 +1,8 @@
+import os
+import pickle
+import sys
+import subprocess
+
 import numpy as np
 import pytest
 
@@ -71,3 +76,68 @@ def test_shuffle_all():
     assert not np.allclose(xt, x)
     assert np.allclose(xt, yt)
     assert np.allclose(yt, zt)
+
+
+def test_append_load_pickles(tmpdir):
+    fname = str(tmpdir.join('journal.pkl'))
+    records = [{'id': i, 'x': np.random.rand(3)} for i in range(5)]
+    for r in records:
+        util.append_pickle(fname, r)
+
+    out = util.load_pickles(fname)
+    assert len(out) == 5
+    assert [o['id'] for o in out] == list(range(5))
+    assert np.allclose(out[3]['x'], records[3]['x'])
+
+    # simulate writer dying while writing the last record
+    with open(fname, 'rb') as fin:
+        data = fin.read()
+    with open(fname, 'wb') as fout:
+        fout.write(data[:-5])
+    out = util.load_pickles(fname)
+    assert [o['id'] for o in out] == list(range(4))
+
+
+def test_load_pickles_truncate(tmpdir):
+    # appending after a crash must not glue new records onto the partial one
+    fname = str(tmpdir.join('journal.pkl'))
+    records = [{'id': i, 'cmd': 'job{}.py --lr 0.1'.format(i), 'x': np.random.rand(3)}
+               for i in range(3)]
+    for r in records:
+        util.append_pickle(fname, r)
+    with open(fname, 'rb') as fin:
+        data = fin.read()
+    last = len(data) - len(pickle.dumps(records[-1]))
+
+    for cut in range(last + 1, len(data)):
+        with open(fname, 'wb') as fout:
+            fout.write(data[:cut])
+        assert [o['id'] for o in util.load_pickles(fname, truncate=True)] == [0, 1]
+        util.append_pickle(fname, {'id': 'new'})
+        assert [o['id'] for o in util.load_pickles(fname)] == [0, 1, 'new']
+
+
+def test_import_time():
+    # importing ce_common must not load heavy dependencies
+    code = ('import sys, time, numpy; t0 = time.time(); '
+            'import ce_common.util, ce_common.math, ce_common.visualization, ce_common.tfutil; '
+            'print(time.time() - t0); print(" ".join(sys.modules))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(util.__file__)))
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=root).decode().split('\n')
+
+    assert float(out[0]) < 0.5
+    modules = out[1].split(' ')
+    for m in ['scipy', 'matplotlib', 'skimage', 'tensorflow']:
+        assert m not in modules
+
+
+def test_lazy_import_dunders():
+    # introspection probes don't import; other dunders (__file__, __version__) do
+    code = ('import sys, inspect; from ce_common import util; '
+            'm = util.lazy_import("colorsys"); '
+            'assert inspect.unwrap(m) is m and "colorsys" not in sys.modules; '
+            'assert m.__file__.endswith("colorsys.py") and "colorsys" in sys.modules; '
+            'assert util.lazy_import("numpy").__version__ == sys.modules["numpy"].__version__; '
+            'assert util.lazy_import("json").__path__')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(util.__file__)))
+    subprocess.check_call([sys.executable, '-c', code], cwd=root)
@@ -0,0 +1,283 @@
+import numpy as np
+import pytest
+
+from ce_common import visualization
+
+
+def tile_imgs_loop(imgs, gap, fill):
+    """ Reference implementation of tile_imgs for uint8 (rows, cols, H, W[, C]) arrays. """
+    nrows, ncols, H, W = imgs.shape[:4]
+    out = np.full((nrows*H + (nrows-1)*gap, ncols*W + (ncols-1)*gap) + imgs.shape[4:],
+                  fill, dtype='uint8')
+    for i in range(nrows):
+        for j in range(ncols):
+            out[i*(H+gap):i*(H+gap)+H, j*(W+gap):j*(W+gap)+W] = imgs[i, j]
+    return out
+
+
+@pytest.mark.parametrize("shape", [(2, 3, 5, 4), (3, 2, 5, 4, 3), (1, 1, 5, 4)])
+@pytest.mark.parametrize("gap", [0, 1, 3])
+def test_tile_imgs(shape, gap):
+    imgs = np.random.randint(0, 256, shape).astype('uint8')
+    out = visualization.tile_imgs(imgs, gap=gap, fill=7)
+    assert np.array_equal(out, tile_imgs_loop(imgs, gap, 7))
+
+    # list of lists
+    lists = [list(row) for row in imgs]
+    assert np.array_equal(visualization.tile_imgs(lists, gap=gap, fill=7), out)
+
+    # reuse canvas
+    canvas = np.zeros_like(out)
+    res = visualization.tile_imgs(imgs, gap=gap, fill=7, out=canvas)
+    assert res is canvas
+    assert np.array_equal(canvas, out)
+
+
+def test_tile_imgs_normalize():
+    imgs = np.random.rand(2, 2, 5, 5)
+    imgs[1, 1] = 0
+    orig = imgs.copy()
+    out = visualization.tile_imgs(imgs)
+    assert out.dtype == np.uint8
+    assert np.array_equal(imgs, orig)
+    # 255*m/m can round to 254.99..; the old per-image loop truncated the same way
+    assert out[:5, :5].max() >= 254
+    assert out[6:, 6:].max() == 0
+
+    for (i, j), (r, c) in [((0, 0), (0, 0)), ((0, 1), (0, 6)), ((1, 0), (6, 0))]:
+        ref = (255 * imgs[i, j] / imgs[i, j].max()).astype('uint8')
+        assert np.array_equal(out[r:r+5, c:c+5], ref)
+
+
+def test_tile_imgs_ncols():
+    imgs = np.random.randint(0, 256, (5, 4, 3, 3)).astype('uint8')
+    out = visualization.tile_imgs(imgs, gap=1, ncols=2)
+    assert out.shape == (3*4 + 2, 2*3 + 1, 3)
+    assert np.array_equal(out[10:, 4:], np.zeros((4, 3, 3)))
+    assert np.array_equal(out[10:, :3], imgs[4])
+
+    # (N, H, W) without ncols is a single row
+    out = visualization.tile_imgs(imgs[..., 0], gap=0)
+    assert out.shape == (4, 15)
+
+
+def test_tile_imgs_out_shape():
+    imgs = np.zeros((2, 2, 3, 3), dtype='uint8')
+    with pytest.raises(ValueError):
+        visualization.tile_imgs(imgs, out=np.zeros((3, 3), dtype='uint8'))
+
+
+def test_draw_markers_img():
+    im = np.random.rand(40, 50)
+    pos = np.array([[10, 12], [30, 25], [48, 2]])  # (x, y); last one partially outside
+    out = visualization.draw_markers_img(im, pos, radius=4)
+    assert out.shape == (40, 50, 3)
+    assert im.ndim == 2
+
+    for x, y in pos:
+        assert np.allclose(out[y, x], (1, 0, 0))
+        assert np.allclose(out[min(y+4, 39), x], im[min(y+4, 39), x])
+
+    # per marker colors
+    colors = np.eye(3)
+    out = visualization.draw_markers_img(im, pos, radius=4, color=colors)
+    for (x, y), c in zip(pos, colors):
+        assert np.allclose(out[y, x], c)
+
+
+def test_draw_inplace():
+    im = np.zeros((20, 20, 3))
+    out = visualization.draw_crosses_img(im, [[5, 5], [10, 15]], radius=4, inplace=True)
+    assert out is im
+    assert im[..., 0].sum() == 2 * 9
+    assert np.allclose(im[15, 8:13, 0], 1)
+    assert np.allclose(im[13:18, 10, 0], 1)
+
+    with pytest.raises(ValueError):
+        visualization.draw_crosses_img(np.zeros((20, 20)), [[5, 5]], inplace=True)
+
+
+def test_draw_boxes_img():
+    im = np.zeros((30, 30, 3))
+    boxes = [[2, 3, 10, 5], [15, 12, 8, 8]]
+    out = visualization.draw_boxes_img(im, boxes)
+    ref = im
+    for b in boxes:
+        ref = visualization.draw_box_img(ref, *b)
+    assert np.array_equal(out, ref)
+    assert not im.any()
+
+
+def test_draw_crosses_img():
+    im = np.zeros((30, 40, 3))
+    # odd radius and fractional positions exercise the truncations (interior only,
+    # since draw_cross_img clips differently at the borders)
+    pos = [[8, 6], [20.7, 15.2], [30, 22]]
+    colors = np.eye(3)
+    for radius in [4, 5]:
+        out = visualization.draw_crosses_img(im, pos, radius=radius, color=colors)
+        ref = im
+        for p, c in zip(pos, colors):
+            ref = visualization.draw_cross_img(ref, p, radius=radius, color=c)
+        assert np.array_equal(out, ref)
+    assert not im.any()
+
+
+def test_lines_pixels_skimage():
+    # arbitrary slopes, including ties, match Bresenham pixel for pixel
+    from skimage.draw import line
+    lines = np.random.RandomState(0).randint(-20, 60, (500, 4))
+    rr, cc, idx = visualization._lines_pixels(*lines.T)
+    for i, l in enumerate(lines):
+        ref = line(*l)
+        assert np.array_equal(rr[idx == i], ref[0])
+        assert np.array_equal(cc[idx == i], ref[1])
+
+    im = np.zeros((40, 40, 3))
+    out = visualization.draw_lines_img(im, lines)
+    ref = np.zeros((40, 40))
+    for l in lines:
+        r, c = line(*l)
+        valid = (r >= 0) & (r < 40) & (c >= 0) & (c < 40)
+        ref[r[valid], c[valid]] = 1
+    assert np.array_equal(out[..., 0], ref)
+
+
+def test_draw_lines_img():
+    im = np.zeros((20, 30, 3))
+    out = visualization.draw_lines_img(im, [[0, 0, 19, 19], [5, -10, 5, 40]])
+    assert np.allclose(out[np.arange(20), np.arange(20), 0], 1)
+    assert np.allclose(out[5, :, 0], 1)
+    assert out[..., 0].sum() == 20 + 30 - 1
+
+    out = visualization.draw_vertical_lines_img(im, [3, 7])
+    assert np.allclose(out[:, [3, 7], 0], 1)
+    assert out[..., 0].sum() == 40
+
+    out = visualization.draw_horizontal_lines_img(im, [3])
+    assert np.allclose(out[3, :, 0], 1)
+    assert out[..., 0].sum() == 30
+
+
+def test_confusion_matrix():
+    m = np.random.rand(50, 50)
+    out = visualization.confusion_matrix(m, labels=list(range(50)), order=np.arange(50)[::-1],
+                                         block=10, interactive=False, return_array=True)
+    assert out.ndim == 3 and out.shape[2] == 3 and out.dtype == np.uint8
+
+    agg = visualization.aggregate_blocks(m, 10)
+    assert agg.shape == (5, 5)
+    assert np.allclose(agg.sum(), m.sum())
+    assert np.allclose(agg[1, 2], m[10:20, 20:30].sum())
+
+
+def test_fig_to_array_redraw():
+    r = visualization.OffscreenRenderer(xlim=(0, 1), ylim=(0, 1), figsize=(2, 2), dpi=20)
+    frames = []
+    for y in [0.2, 0.8]:
+        r.render(([0, 1], [y, y]))
+        frames.append(visualization.fig_to_array(r.fig, draw=False))
+    assert not np.shares_memory(frames[0], frames[1])
+    assert not np.array_equal(frames[0], frames[1])
+
+    # render returns views of the same buffer unless copied
+    a, b = r.render(([0, 1], [0.2, 0.2])), r.render(([0, 1], [0.8, 0.8]))
+    assert np.shares_memory(a, b)
+    c = r.render(([0, 1], [0.2, 0.2]), copy=True)
+    assert not np.shares_memory(b, c)
+    assert np.array_equal(c, frames[0])
+
+
+def test_confusion_matrix_block_labels():
+    m = np.random.rand(6, 6)
+    order = np.arange(6)[::-1]
+    for labels, expected in [(['c{}'.format(i) for i in range(6)], ['c5-c3', 'c2-c0']),
+                             ([], ['5-3', '2-0'])]:
+        fig = visualization.confusion_matrix(m, labels=labels, order=order, block=3,
+                                             interactive=False)
+        ax = fig.axes[0]
+        assert [t.get_text() for t in ax.get_xticklabels()] == expected
+        assert [t.get_text() for t in ax.get_yticklabels()] == expected
+
+
+def test_confusion_matrix_closes_figure():
+    import matplotlib.pyplot as plt
+    nfigs = len(plt.get_fignums())
+    out = visualization.confusion_matrix(np.eye(3), return_array=True)
+    assert out.ndim == 3
+    assert len(plt.get_fignums()) == nfigs
+
+
+def _read_gif(fname):
+    """ Return frames (as RGB arrays) and per-frame durations of a gif. """
+    from PIL import Image, ImageSequence
+    with Image.open(fname) as im:
+        return ([np.array(f.convert('RGB')) for f in ImageSequence.Iterator(im)],
+                [f.info['duration'] for f in ImageSequence.Iterator(im)])
+
+
+def _color_frame(color, shape=(8, 12)):
+    frame = np.zeros(shape + (3,), dtype='uint8')
+    frame[:, :shape[1]//2] = color
+    return frame
+
+
+def test_gif_writer(tmpdir):
+    fname = str(tmpdir.join('out.gif'))
+    gray = np.tile(np.linspace(0, 1, 12), (8, 1))
+    rgba = np.concatenate([_color_frame((0, 255, 0)), np.full((8, 12, 1), 255, 'uint8')], -1)
+    with visualization.GifWriter(fname, fps=20) as writer:
+        writer.write(_color_frame((255, 0, 0)))
+        writer.write(gray)
+        writer.write(rgba)
+    frames, durations = _read_gif(fname)
+
+    assert len(frames) == 3
+    assert durations == [50] * 3
+    # adaptive palettes: few colors are kept exactly
+    assert np.array_equal(frames[0], _color_frame((255, 0, 0)))
+    assert np.array_equal(frames[1][..., 0], (255 * gray).astype('uint8'))
+    assert np.array_equal(frames[2], rgba[..., :3])
+
+    visualization.save_gif([gray] * 2, fname, delay=20)
+    frames, durations = _read_gif(fname)
+    assert len(frames) == 2
+    assert durations == [200] * 2
+
+
+def test_gif_writer_palettes(tmpdir):
+    fname = str(tmpdir.join('out.gif'))
+    red, green = _color_frame((255, 0, 0)), _color_frame((0, 255, 0))
+
+    # 'first': later frames are mapped to the first frame's colors
+    with visualization.GifWriter(fname, palette='first') as writer:
+        writer.write_all([red, green])
+    frames, _ = _read_gif(fname)
+    assert np.array_equal(frames[0], red)
+    assert set(map(tuple, frames[1].reshape(-1, 3))) <= {(255, 0, 0), (0, 0, 0)}
+
+    # fixed palette: every frame uses only its colors
+    palette = np.array([[0, 0, 0], [0, 0, 255]])
+    with visualization.GifWriter(fname, palette=palette) as writer:
+        writer.write_all([red, green])
+    frames, _ = _read_gif(fname)
+    for f in frames:
+        assert set(map(tuple, f.reshape(-1, 3))) <= {(0, 0, 0), (0, 0, 255)}
+
+    with pytest.raises(ValueError):
+        visualization.GifWriter(fname, palette='nearest')
+    with visualization.GifWriter(fname) as writer:
+        writer.write(red)
+        with pytest.raises(ValueError):
+            writer.write(_color_frame((255, 0, 0), shape=(8, 10)))
+
+
+def test_confusion_matrix_large():
+    # a single confusion must survive downsampling a 2000x2000 matrix to the axes
+    m = np.zeros((2000, 2000))
+    m[0, 0] = 1
+    m2 = m.copy()
+    m2[1003, 517] = 1
+    a, b = [visualization.confusion_matrix(x, interactive=False, return_array=True)
+            for x in [m, m2]]
+    assert (a != b).any()